@@ -0,0 +1,39 @@
+"""Добавил таблицу user_stats
+
+Revision ID: 3f7b9d2e6c81
+Revises: 8a4e6b2c1d57
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f7b9d2e6c81'
+down_revision: Union[str, None] = '8a4e6b2c1d57'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('user_stats',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('likes_received', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('comments_received', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('forks_received', sa.Integer(), server_default='0', nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    # Заполнение из счётчиков шейдеров
+    op.execute(
+        "INSERT INTO user_stats (user_id, likes_received, comments_received, forks_received) "
+        "SELECT user_id, sum(likes_count), sum(comments_count), sum(forks_count) "
+        "FROM shaders GROUP BY user_id"
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('user_stats')
@@ -0,0 +1,65 @@
+"""Добавил счётчики лайков, комментариев и форков в shader
+
+Revision ID: 5c2d7e1f9a30
+Revises: a23a1090b90f
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c2d7e1f9a30'
+down_revision: Union[str, None] = 'a23a1090b90f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (имя, колонка сортировки) частичных индексов по видимым шейдерам
+INDEXES = [
+    ('ix_shaders_visible_likes_count', 'likes_count'),
+    ('ix_shaders_visible_comments_count', 'comments_count'),
+]
+
+
+def upgrade() -> None:
+    op.add_column('shaders', sa.Column('likes_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('shaders', sa.Column('comments_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('shaders', sa.Column('forks_count', sa.Integer(), server_default='0', nullable=False))
+
+    # Заполнение счётчиков по существующим данным
+    op.execute("""
+        UPDATE shaders SET likes_count = l.cnt
+        FROM (SELECT shader_id, count(*) AS cnt FROM likes GROUP BY shader_id) AS l
+        WHERE shaders.id = l.shader_id
+    """)
+    op.execute("""
+        UPDATE shaders SET comments_count = c.cnt
+        FROM (SELECT shader_id, count(*) AS cnt FROM comments GROUP BY shader_id) AS c
+        WHERE shaders.id = c.shader_id
+    """)
+    op.execute("""
+        UPDATE shaders SET forks_count = f.cnt
+        FROM (SELECT id_forked, count(*) AS cnt FROM shaders WHERE id_forked IS NOT NULL GROUP BY id_forked) AS f
+        WHERE shaders.id = f.id_forked
+    """)
+
+    # Индексы строятся без блокировки записи в shaders. CREATE INDEX CONCURRENTLY не может выполняться
+    # внутри транзакции, поэтому счётчики выше фиксируются до начала построения
+    with op.get_context().autocommit_block():
+        for name, column in INDEXES:
+            op.create_index(name, 'shaders', [sa.text(f'{column} DESC'), sa.text('id DESC')],
+                            postgresql_concurrently=True,
+                            postgresql_where=sa.text('visibility'),
+                            if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, _ in reversed(INDEXES):
+            op.drop_index(name, table_name='shaders', postgresql_concurrently=True, if_exists=True)
+    op.drop_column('shaders', 'forks_count')
+    op.drop_column('shaders', 'comments_count')
+    op.drop_column('shaders', 'likes_count')
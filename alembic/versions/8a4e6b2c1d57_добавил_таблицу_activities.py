@@ -0,0 +1,39 @@
+"""Добавил таблицу activities
+
+Revision ID: 8a4e6b2c1d57
+Revises: 5c2d7e1f9a30
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8a4e6b2c1d57'
+down_revision: Union[str, None] = '5c2d7e1f9a30'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('activities',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('type', sa.String(), nullable=False),
+    sa.Column('created_at', sa.TIMESTAMP(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('shader_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['shader_id'], ['shaders.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_activities_user_id_created_at_id', 'activities',
+                    ['user_id', sa.text('created_at DESC'), sa.text('id DESC')])
+    # Существующие лайки, комментарии и форки переносятся командой python -m app.db.backfill
+
+
+def downgrade() -> None:
+    op.drop_index('ix_activities_user_id_created_at_id', table_name='activities')
+    op.drop_table('activities')
@@ -0,0 +1,45 @@
+"""Добавил индексы для горячих запросов
+
+Revision ID: c41e8f0a7b92
+Revises: 3f7b9d2e6c81
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c41e8f0a7b92'
+down_revision: Union[str, None] = '3f7b9d2e6c81'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (имя, таблица, колонки, условие частичного индекса)
+INDEXES = [
+    ('ix_likes_shader_id', 'likes', ['shader_id'], None),
+    ('ix_likes_user_id_shader_id', 'likes', ['user_id', 'shader_id'], None),
+    ('ix_comments_shader_id_created_at_id', 'comments', ['shader_id', 'created_at', 'id'], None),
+    ('ix_shaders_visible_created_at', 'shaders', [sa.text('created_at DESC'), sa.text('id DESC')], 'visibility'),
+    ('ix_shaders_user_id_created_at', 'shaders', ['user_id', sa.text('created_at DESC')], None),
+    ('ix_shaders_id_forked', 'shaders', ['id_forked'], 'id_forked IS NOT NULL'),
+    ('ix_activities_shader_id', 'activities', ['shader_id'], None),
+]
+
+
+def upgrade() -> None:
+    # CREATE INDEX CONCURRENTLY не блокирует запись, но не может выполняться внутри транзакции
+    with op.get_context().autocommit_block():
+        for name, table, columns, where in INDEXES:
+            op.create_index(name, table, columns,
+                            postgresql_concurrently=True,
+                            postgresql_where=sa.text(where) if where else None,
+                            if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
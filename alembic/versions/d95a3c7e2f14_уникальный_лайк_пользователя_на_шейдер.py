@@ -0,0 +1,92 @@
+"""Уникальный лайк пользователя на шейдер
+
+Revision ID: d95a3c7e2f14
+Revises: c41e8f0a7b92
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd95a3c7e2f14'
+down_revision: Union[str, None] = 'c41e8f0a7b92'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEX = 'uq_likes_user_id_shader_id'
+# Сколько раз очистка и построение индекса повторяются, если дубликат успел появиться между ними
+BUILD_ATTEMPTS = 5
+
+
+def remove_duplicates() -> None:
+    # Дубликаты от двойных кликов: остаётся самый ранний лайк и самая ранняя запись в ленте
+    op.execute(
+        "DELETE FROM likes l USING likes d "
+        "WHERE l.user_id = d.user_id AND l.shader_id = d.shader_id AND l.id > d.id"
+    )
+    op.execute(
+        "DELETE FROM activities a USING activities d "
+        "WHERE a.type = 'like' AND d.type = 'like' "
+        "AND a.user_id = d.user_id AND a.shader_id = d.shader_id AND a.id > d.id"
+    )
+
+
+def drop_invalid_index() -> None:
+    # Прерванный CREATE INDEX CONCURRENTLY оставляет невалидный индекс, который if_not_exists пропустил бы
+    invalid = op.get_bind().scalar(
+        sa.text("SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)"),
+        {"name": INDEX}
+    )
+    if invalid:
+        op.drop_index(INDEX, table_name='likes', postgresql_concurrently=True)
+
+
+def build_unique_index() -> None:
+    # Индекс строится без блокировки записи, поэтому между очисткой и построением приложение может
+    # вставить новый дубликат. Тогда построение падает, и очистка повторяется
+    for attempt in range(BUILD_ATTEMPTS):
+        drop_invalid_index()
+        remove_duplicates()
+        try:
+            op.create_index(INDEX, 'likes', ['user_id', 'shader_id'],
+                            unique=True, postgresql_concurrently=True, if_not_exists=True)
+            return
+        except sa.exc.IntegrityError:
+            if attempt == BUILD_ATTEMPTS - 1:
+                raise
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        # При повторном запуске ограничение может уже существовать
+        has_constraint = op.get_bind().scalar(
+            sa.text("SELECT 1 FROM pg_constraint WHERE conname = :name"), {"name": INDEX}
+        )
+        if not has_constraint:
+            build_unique_index()
+            op.execute(f"ALTER TABLE likes ADD CONSTRAINT {INDEX} UNIQUE USING INDEX {INDEX}")
+        op.drop_index('ix_likes_user_id_shader_id', table_name='likes',
+                      postgresql_concurrently=True, if_exists=True)
+
+        # Счётчики пересчитываются после последней очистки
+        op.execute(
+            "UPDATE shaders s SET likes_count = l.count "
+            "FROM (SELECT shader_id, count(*) AS count FROM likes GROUP BY shader_id) l "
+            "WHERE l.shader_id = s.id AND s.likes_count <> l.count"
+        )
+        op.execute(
+            "UPDATE user_stats u SET likes_received = t.total "
+            "FROM (SELECT user_id, sum(likes_count) AS total FROM shaders GROUP BY user_id) t "
+            "WHERE t.user_id = u.user_id AND u.likes_received <> t.total"
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index('ix_likes_user_id_shader_id', 'likes', ['user_id', 'shader_id'],
+                        postgresql_concurrently=True, if_not_exists=True)
+        op.drop_constraint('uq_likes_user_id_shader_id', 'likes', type_='unique')
@@ -0,0 +1,43 @@
+"""Добавил хранилище изображений blobs
+
+Revision ID: e6b2f8a4c390
+Revises: d95a3c7e2f14
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e6b2f8a4c390'
+down_revision: Union[str, None] = 'd95a3c7e2f14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('blobs',
+    sa.Column('sha256', sa.String(length=64), nullable=False),
+    sa.Column('kind', sa.String(), nullable=False),
+    sa.Column('ref_count', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('created_at', sa.TIMESTAMP(), nullable=False),
+    sa.Column('released_at', sa.TIMESTAMP(), nullable=True),
+    sa.PrimaryKeyConstraint('sha256', 'kind')
+    )
+    op.create_index('ix_blobs_released_at', 'blobs', ['released_at'], postgresql_where=sa.text('ref_count = 0'))
+    # Ссылки на уже загруженные изображения нового вида
+    op.execute(
+        "INSERT INTO blobs (sha256, kind, ref_count, created_at) "
+        "SELECT substring(url from '^[a-z]+/([0-9a-f]{64})_'), substring(url from '^([a-z]+)/'), count(*), now() "
+        "FROM (SELECT avatar_url AS url FROM users UNION ALL SELECT background_url FROM users) urls "
+        "WHERE url ~ '^(avatars|backgrounds)/[0-9a-f]{64}_[0-9]+\\.webp$' "
+        "GROUP BY 1, 2"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_blobs_released_at', table_name='blobs', postgresql_where=sa.text('ref_count = 0'))
+    op.drop_table('blobs')
@@ -1,4 +1,5 @@
 from . import api
+from . import cache
 from . import db
 from . import exceptions
 from . import models
@@ -13,5 +14,6 @@ __all__ = [
     "schemas",
     "models",
     "db",
+    "cache",
     "api"
 ]
@@ -1,13 +1,25 @@
 from . import auth
 from . import comments
+from . import conditional
+from . import images
 from . import likes
+from . import metrics
 from . import profile
 from . import shaders
+from . import static
+from . import streaming
+from . import uploads
 
 __all__ = [
     "auth",
     "shaders",
     "profile",
     "likes",
-    "comments"
+    "comments",
+    "conditional",
+    "images",
+    "metrics",
+    "static",
+    "streaming",
+    "uploads"
 ]
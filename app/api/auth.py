@@ -2,8 +2,8 @@ import datetime
 
 from fastapi import APIRouter, Response, Request
 from fastapi.params import Depends
-from jose import jwt, JWTError
-from sqlalchemy import select
+from jose import JWTError
+from sqlalchemy import select, update
 
 from app.db.base import async_session
 from app.exceptions import (UserAlreadyExistsException,
@@ -12,15 +12,18 @@ from app.exceptions import (UserAlreadyExistsException,
                             UserIdNotFoundException,
                             TokenExpiredException,
                             RefreshTokenNotFound,
-                            InvalidRefreshTokenException)
+                            InvalidRefreshTokenException,
+                            UserNotFoundException,
+                            PasswordChangedException)
 from app.models.user import User as MUser
-from app.models.shader import Shader as MShader
 from app.schemas.auth.update_password import UpdatePassword
 from app.schemas.auth.user_login import UserLogin
 from app.schemas.auth.user_register import UserRegister
-from app.security.dependencies import get_current_user
-from app.security.utils import get_password_hash, verify_password, create_refresh_token, create_access_token
-from app.settings import settings
+from app.security.dependencies import get_current_user_id
+from app.security.hashing import hash_password, check_password, check_and_update_password
+from app.security.tokens import decode_token
+from app.security.users import get_user, invalidate_user
+from app.security.utils import create_refresh_token, create_access_token
 
 router = APIRouter(
     prefix="/auth",
@@ -36,10 +39,12 @@ async def register(user: UserRegister, response: Response):
             .where(MUser.email == user.email)
         )
         existing_user = result.scalar()
-        if existing_user:
-            raise UserAlreadyExistsException
+    if existing_user:
+        raise UserAlreadyExistsException
 
-        hashed_password = get_password_hash(user.password)
+    # Хеширование идёт вне сессии, чтобы не держать соединение из пула
+    hashed_password = await hash_password(user.password)
+    async with async_session() as session:
         user = MUser(
             email=str(user.email),
             name=user.name,
@@ -72,19 +77,31 @@ async def login(response: Response, user: UserLogin):
             .where(MUser.email == user.email)
         )
         existing_user = result.scalar()
-        if not existing_user:
-            raise UserNotExistsException
+    if not existing_user:
+        raise UserNotExistsException
+
+    password_is_valid, new_hash = await check_and_update_password(user.password, existing_user.hashed_password)
+    if not password_is_valid:
+        raise InvalidPasswordException
 
-        password_is_valid = verify_password(user.password, existing_user.hashed_password)
-        if not password_is_valid:
-            raise InvalidPasswordException
-        access_token = create_access_token({"sub": str(existing_user.id)})
-        refresh_token = create_refresh_token({"sub": str(existing_user.id)})
-        response.set_cookie("access_token", access_token, httponly=True)
-        response.set_cookie("refresh_token", refresh_token, httponly=True)
-        return {
-            "message": "Successfully logged in",
-        }
+    # Стоимость bcrypt изменилась, сохраняем пересчитанный хеш
+    if new_hash is not None:
+        async with async_session() as session:
+            await session.execute(
+                update(MUser)
+                .where(MUser.id == existing_user.id)
+                .values(hashed_password=new_hash)
+            )
+            await session.commit()
+        await invalidate_user(existing_user.id)
+
+    access_token = create_access_token({"sub": str(existing_user.id)})
+    refresh_token = create_refresh_token({"sub": str(existing_user.id)})
+    response.set_cookie("access_token", access_token, httponly=True)
+    response.set_cookie("refresh_token", refresh_token, httponly=True)
+    return {
+        "message": "Successfully logged in",
+    }
 
 
 @router.post("/logout")
@@ -100,16 +117,14 @@ async def refresh(request: Request, response: Response):
     if not refresh_token:
         raise RefreshTokenNotFound
     try:
-        payload = jwt.decode(refresh_token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        payload = decode_token(refresh_token)
     except JWTError:
         raise InvalidRefreshTokenException
     user_id = payload.get('sub')
     if not user_id:
         raise UserIdNotFoundException
 
-    async with async_session() as session:
-        result = await session.execute(select(MUser).where(MUser.id == int(user_id)))
-        user = result.scalars().first()
+    user = await get_user(int(user_id))
     if not user:
         raise UserNotExistsException
 
@@ -129,7 +144,7 @@ async def get_me(request: Request):
         return None
 
     try:
-        payload = jwt.decode(access_token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        payload = decode_token(access_token)
     except JWTError:
         return None
 
@@ -140,9 +155,7 @@ async def get_me(request: Request):
     if not user_id:
         return None
 
-    async with async_session() as session:
-        result = await session.execute(select(MUser).where(MUser.id == int(user_id)))
-        user = result.scalars().first()
+    user = await get_user(int(user_id))
 
     if not user:
         raise UserNotExistsException
@@ -151,13 +164,27 @@ async def get_me(request: Request):
 
 
 @router.patch("/password")
-async def update_password(body: UpdatePassword, user: MUser = Depends(get_current_user)):
-    if not verify_password(body.oldPassword, user.hashed_password):
+async def update_password(body: UpdatePassword, user_id: int = Depends(get_current_user_id)):
+    # Хеша нет в кэше пользователя, он читается из основной базы.
+    # Хеширование идёт вне сессии, чтобы не держать соединение из пула
+    async with async_session() as session:
+        current_hash = await session.scalar(select(MUser.hashed_password).where(MUser.id == user_id))
+    if current_hash is None:
+        raise UserNotFoundException
+    if not await check_password(body.oldPassword, current_hash):
         raise InvalidPasswordException
+    new_hash = await hash_password(body.newPassword)
 
+    # Хеш меняется, только если его не сменили, пока шла проверка: иначе старый пароль проверен по устаревшему хешу
     async with async_session() as session:
-        user.hashed_password = get_password_hash(body.newPassword)
-        session.add(user)
+        result = await session.execute(
+            update(MUser)
+            .where((MUser.id == user_id) & (MUser.hashed_password == current_hash))
+            .values(hashed_password=new_hash)
+        )
         await session.commit()
-        await session.refresh(user)
+    if result.rowcount == 0:
+        raise PasswordChangedException
+
+    await invalidate_user(user_id)
     return
@@ -1,15 +1,32 @@
 import datetime
+from functools import partial
+from typing import Literal
 
-from fastapi import APIRouter, HTTPException
-from fastapi.params import Depends
-from sqlalchemy import select, update
+import orjson
 
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.params import Depends, Query
+from fastapi.responses import Response
+from sqlalchemy import select, update, func, literal_column
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+
+from app.api.conditional import make_etag, has_validators, is_not_modified, not_modified, set_validators
+from app.api.images import image_variant, image_variant_sql, AVATAR_LIST_SIZE
+from app.api.streaming import wants_ndjson, ndjson_response
+from app.cache.base import cache, shader_key, comments_key, invalidate_gallery
 from app.db.base import async_session
+from app.db.pagination import encode_cursor, decode_cursor, keyset_condition
+from app.db.replicas import read_session, prefer_primary
+from app.db.user_stats import change_user_stats
+from app.models.activity import Activity as MActivity
 from app.models.comment import Comment as MComment
+from app.models.shader import Shader as MShader
 from app.models.user import User as MUser
+from app.schemas.comment.comment_out import CommentOut
 from app.schemas.comment.post_comment import PostComment as SComment
 from app.schemas.comment.toggle_hidden import ToggleHidden
 from app.security.dependencies import get_current_user
+from app.settings import settings
 
 router = APIRouter(
     prefix="/comments",
@@ -17,33 +34,119 @@ router = APIRouter(
 )
 
 
+def authors_version(page):
+    # Имена и аватары авторов встроены в ответ, а времени изменения у пользователя нет,
+    # поэтому в версию идёт хеш их текущих значений на странице
+    return (
+        select(func.md5(func.string_agg(
+            func.concat_ws(":", page.c.user_id, page.c.username, page.c.avatar_url),
+            aggregate_order_by(literal_column("','"), page.c.id)
+        )))
+        .scalar_subquery()
+    )
+
+
+def comments_version(shader_id: int, limit: int, order: str, cursor: str | None):
+    # Дешёвая сводка состояния комментариев шейдера для ETag вместе с авторами запрошенной страницы.
+    # Last-Modified не отдаётся: скрытие комментария и правки авторов не меняют времени создания
+    page = comments_query(shader_id, order, cursor).limit(limit).subquery()
+    return (
+        select(func.max(MComment.id),
+               func.count(MComment.id),
+               func.count(MComment.id).filter(MComment.hidden),
+               authors_version(page))
+        .where(MComment.shader_id == shader_id)
+    )
+
+
 @router.get("/{shader_id}")
-async def get_comments(shader_id: int):
-    async with async_session() as session:
-        result = await session.execute(
-            select(MComment, MUser.name.label("username"), MUser.avatar_url.label("avatar_url"))
-            .join(MUser, MComment.user_id == MUser.id)
-            .where(MComment.shader_id == shader_id)
-            .order_by(MComment.created_at.asc())
-        )
-        rows = result.all()
-        comments = []
-        for comment, username, avatar_url in rows:
-            comments.append({
-                "id": comment.id,
-                "text": comment.text if not comment.hidden else "Hidden",
-                "hidden": comment.hidden,
-                "created_at": comment.created_at,
-                "user_id": comment.user_id,
-                "shader_id": comment.shader_id,
-                "username": username,
-                "avatar_url": avatar_url,
-            })
-        print(comments)
-        return comments
-
-
-@router.post("/{shader_id}")
+async def get_comments(
+        shader_id: int,
+        request: Request,
+        limit: int = Query(default=settings.COMMENTS_PAGE_SIZE, ge=1, le=100),
+        order: Literal["asc", "desc"] = Query(default="asc"),
+        cursor: str | None = Query(default=None)
+):
+    if wants_ndjson(request):
+        # Все комментарии потоком, без кэша и постраничной выдачи
+        return await ndjson_response(request, comments_query(shader_id, order, cursor), comment_json)
+
+    # В кэше только первая страница в порядке по умолчанию, её и запрашивают чаще всего.
+    # После записи клиент читает основную базу мимо кэша
+    cacheable = (cursor is None and order == "asc" and limit == settings.COMMENTS_PAGE_SIZE
+                 and not prefer_primary.get())
+    cached = await cache.get(comments_key(shader_id)) if cacheable else None
+    if cached is None:
+        if has_validators(request):
+            # Дешёвая проверка версии до построения страницы
+            async with read_session() as session:
+                version = (await session.execute(comments_version(shader_id, limit, order, cursor))).one()
+            etag = make_etag(*version, limit, order, cursor)
+            if is_not_modified(request, etag):
+                return not_modified(etag)
+
+        if cacheable:
+            # Кэш заполняется из основной базы, иначе отстающая реплика положила бы в него страницу до записи
+            cached = await cache.get_or_set(comments_key(shader_id),
+                                            partial(fetch_comments, async_session, shader_id, limit, order, cursor))
+        else:
+            cached = await fetch_comments(read_session, shader_id, limit, order, cursor)
+
+    etag, comments, next_cursor = cached
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+
+    response = Response(content=comments, media_type="application/json")
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
+    set_validators(response, etag)
+    return response
+
+
+def comments_query(shader_id: int, order: str, cursor: str | None):
+    descending = order == "desc"
+    columns = [MComment.created_at, MComment.id]
+
+    query = (
+        select(MComment.id,
+               MComment.text,
+               MComment.hidden,
+               MComment.created_at,
+               MComment.user_id,
+               MComment.shader_id,
+               MUser.name.label("username"),
+               image_variant_sql(MUser.avatar_url, AVATAR_LIST_SIZE).label("avatar_url"))
+        .join(MUser, MComment.user_id == MUser.id)
+        .where(MComment.shader_id == shader_id)
+        .order_by(*(column.desc() if descending else column.asc() for column in columns))
+    )
+    if cursor is not None:
+        last = decode_cursor(cursor, f"comments_{order}", datetime.datetime.fromisoformat)
+        query = query.where(keyset_condition(columns, last, descending))
+    return query
+
+
+def comment_json(row) -> dict:
+    comment = dict(row)
+    if comment["hidden"]:
+        comment["text"] = "Hidden"
+    return comment
+
+
+async def fetch_comments(make_session, shader_id: int, limit: int, order: str, cursor: str | None):
+    async with make_session() as session:
+        version = (await session.execute(comments_version(shader_id, limit, order, cursor))).one()
+        rows = (await session.execute(comments_query(shader_id, order, cursor).limit(limit))).mappings().all()
+
+    next_cursor = None
+    if len(rows) == limit:
+        next_cursor = encode_cursor(f"comments_{order}", rows[-1]["created_at"], rows[-1]["id"])
+    comments = [comment_json(row) for row in rows]
+    # В кэше уже готовое тело ответа
+    return make_etag(*version, limit, order, cursor), orjson.dumps(comments).decode(), next_cursor
+
+
+@router.post("/{shader_id}", response_model=CommentOut)
 async def create_comment(
         shader_id: int,
         comment: SComment,
@@ -58,8 +161,18 @@ async def create_comment(
             shader_id=shader_id
         )
         session.add(mcomment)
+        session.add(MActivity(type="comment", created_at=mcomment.created_at, user_id=user.id, shader_id=shader_id))
+        await session.execute(
+            update(MShader)
+            .where(MShader.id == shader_id)
+            .values(comments_count=MShader.comments_count + 1)
+        )
+        await session.execute(change_user_stats(shader_id, comments=1))
         await session.commit()
         await session.refresh(mcomment)
+
+        await cache.delete(shader_key(shader_id), comments_key(shader_id))
+        await invalidate_gallery()
         return {
             "id": mcomment.id,
             "text": mcomment.text,
@@ -68,10 +181,10 @@ async def create_comment(
             "user_id": mcomment.user_id,
             "shader_id": mcomment.shader_id,
             "username": user.name,
-            "avatar_url": user.avatar_url
+            "avatar_url": image_variant(user.avatar_url, AVATAR_LIST_SIZE)
         }
 
-@router.patch("/{comment_id}")
+@router.patch("/{comment_id}", response_model=CommentOut)
 async def toggle_hidden(
     comment_id: int,
     body: ToggleHidden,
@@ -89,6 +202,7 @@ async def toggle_hidden(
         await session.commit()
         await session.refresh(comment)
 
+        await cache.delete(shader_key(comment.shader_id), comments_key(comment.shader_id))
         comment.text = "Hidden" if comment.hidden else comment.text
         return comment
 
@@ -0,0 +1,47 @@
+import datetime
+import hashlib
+from email.utils import format_datetime, parsedate_to_datetime
+
+from fastapi import Request, Response, status
+
+
+def make_etag(*parts) -> str:
+    digest = hashlib.sha256(repr(parts).encode()).hexdigest()[:32]
+    return f'"{digest}"'
+
+
+def has_validators(request: Request) -> bool:
+    return "if-none-match" in request.headers or "if-modified-since" in request.headers
+
+
+def is_not_modified(request: Request, etag: str, last_modified: datetime.datetime | None = None) -> bool:
+    # If-None-Match имеет приоритет над If-Modified-Since (RFC 9110, 13.1.3)
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is None or last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=datetime.UTC)
+    return last_modified.replace(tzinfo=datetime.UTC, microsecond=0) <= since
+
+
+def set_validators(response: Response, etag: str, last_modified: datetime.datetime | None = None) -> None:
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    if last_modified is not None:
+        # Время в БД хранится в UTC без часового пояса
+        response.headers["Last-Modified"] = format_datetime(last_modified.replace(tzinfo=datetime.UTC), usegmt=True)
+
+
+def not_modified(etag: str, last_modified: datetime.datetime | None = None) -> Response:
+    response = Response(status_code=status.HTTP_304_NOT_MODIFIED)
+    set_validators(response, etag, last_modified)
+    return response
@@ -0,0 +1,211 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+from fastapi import UploadFile
+from sqlalchemy import func, select, or_
+from sqlalchemy.exc import SQLAlchemyError
+from starlette.concurrency import run_in_threadpool
+
+from app.api.uploads import PUBLIC_DIR, remove_public_file, save_upload
+from app.db.base import async_session
+from app.db.blobs import acquire_blob, release_blob, collect_blobs
+from app.exceptions import ServerBusyException, UnsupportedFileTypeException
+from app.models.user import User as MUser
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Размеры вариантов по каталогу загрузки по возрастанию: аватары обрезаются в квадрат, фоны вписываются в рамку
+VARIANTS = {
+    "avatars": (64, 256),
+    "backgrounds": (1920,),
+}
+# Какой вариант нужен в каком месте интерфейса
+AVATAR_LIST_SIZE = 64
+AVATAR_PROFILE_SIZE = 256
+BACKGROUND_SIZE = 1920
+
+WEBP_QUALITY = 80
+# Загрузка до 5 МБ может распаковаться в гигапиксели; больше этого не разбирается (около 100 МБ в RGBA)
+MAX_IMAGE_PIXELS = 25_000_000
+VARIANT_PATTERN = re.compile(r"_\d+\.webp$")
+
+
+def image_variant(url: str | None, size: int) -> str | None:
+    # Загрузки до появления вариантов остаются как есть
+    if url is None or not VARIANT_PATTERN.search(url):
+        return url
+    return VARIANT_PATTERN.sub(f"_{size}.webp", url)
+
+
+def image_variant_sql(column, size: int):
+    # То же, что image_variant, для ответов, которые собираются в Postgres
+    return func.regexp_replace(column, VARIANT_PATTERN.pattern, f"_{size}.webp")
+
+
+def make_variants(source: str, target_stem: str, sizes: tuple[int, ...], square: bool) -> None:
+    # Выполняется в отдельном процессе. В WebP не переносятся EXIF и прочие метаданные.
+    # Размер проверяется по заголовку до декодирования: Pillow сам отказывает только при вдвое большем
+    Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+    with Image.open(source) as image:
+        if image.width * image.height > MAX_IMAGE_PIXELS:
+            raise Image.DecompressionBombError(f"Image has {image.width * image.height} pixels")
+        image = ImageOps.exif_transpose(image)
+        image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+        for size in sizes:
+            if square:
+                variant = ImageOps.fit(image, (size, size), Image.Resampling.LANCZOS)
+            else:
+                variant = image.copy()
+                variant.thumbnail((size, size), Image.Resampling.LANCZOS)
+            variant.info = {}
+
+            # Одинаковую картинку могут одновременно обрабатывать разные процессы
+            target = f"{target_stem}_{size}.webp"
+            temp = f"{target}.{os.getpid()}.part"
+            variant.save(temp, "WEBP", quality=WEBP_QUALITY, method=4)
+            os.replace(temp, target)
+
+
+class ImageExecutor:
+    # Ограниченный пул процессов для обработки изображений: Pillow держит GIL на ресайзе,
+    # поэтому потоков недостаточно. При переполнении очереди запрос сразу отклоняется.
+    # Процессы порождаются через forkserver, а не fork из многопоточного воркера с открытыми соединениями,
+    # и если процесс погиб (например, убит по памяти), пул пересоздаётся
+
+    def __init__(self, workers: int, queue_limit: int):
+        self.workers = workers
+        self._executor = self._create_executor()
+        self.limit = workers + queue_limit
+        self.in_flight = 0
+        self.rejected = 0
+        self.restarts = 0
+        self.calls = 0
+        self.seconds_total = 0.0
+        self.seconds_max = 0.0
+
+    async def run(self, fn, *args):
+        if self.in_flight >= self.limit:
+            self.rejected += 1
+            raise ServerBusyException
+
+        started = time.perf_counter()
+        executor = self._executor
+        self.in_flight += 1
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+        except BrokenProcessPool:
+            # Сломанный пул больше не принимает задачи; его пересоздаёт первая заметившая это задача
+            if executor is self._executor:
+                logger.error("Image processing pool is broken, restarting it")
+                self._executor = self._create_executor()
+                self.restarts += 1
+                executor.shutdown(wait=False)
+            raise ServerBusyException
+        finally:
+            self.in_flight -= 1
+
+        duration = time.perf_counter() - started
+        self.calls += 1
+        self.seconds_total += duration
+        self.seconds_max = max(self.seconds_max, duration)
+        return result
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("forkserver"))
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True)
+
+    def metrics(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "limit": self.limit,
+            "rejected": self.rejected,
+            "restarts": self.restarts,
+            "calls": self.calls,
+            "seconds_avg": self.seconds_total / self.calls if self.calls else 0.0,
+            "seconds_max": self.seconds_max,
+        }
+
+
+images = ImageExecutor(workers=settings.IMAGE_WORKERS, queue_limit=settings.IMAGE_QUEUE_LIMIT)
+
+
+def variant_urls(sha256: str, kind: str) -> list[str]:
+    return [f"{kind}/{sha256}_{size}.webp" for size in VARIANTS[kind]]
+
+
+def variants_exist(sha256: str, kind: str) -> bool:
+    return all(os.path.exists(os.path.join(PUBLIC_DIR, url)) for url in variant_urls(sha256, kind))
+
+
+async def remove_blob_files(sha256: str, kind: str) -> None:
+    for url in variant_urls(sha256, kind):
+        await run_in_threadpool(remove_public_file, url)
+
+
+async def store_image(upload: UploadFile, kind: str) -> str:
+    # Изображения хранятся по хешу содержимого: одинаковые загрузки разных пользователей лежат в одних файлах,
+    # а файл по URL никогда не меняется и может кэшироваться навсегда. Возвращает URL самого большого варианта
+    original_url, sha256 = await save_upload(upload, kind)
+    try:
+        async with async_session() as session:
+            await acquire_blob(session, sha256, kind)
+            await session.commit()
+
+        try:
+            if not await run_in_threadpool(variants_exist, sha256, kind):
+                await images.run(make_variants,
+                                 os.path.join(PUBLIC_DIR, original_url),
+                                 os.path.join(PUBLIC_DIR, f"{kind}/{sha256}"),
+                                 VARIANTS[kind],
+                                 kind == "avatars")
+        except BaseException as e:
+            await release_image(variant_urls(sha256, kind)[-1])
+            if isinstance(e, (UnidentifiedImageError, Image.DecompressionBombError, OSError)):
+                raise UnsupportedFileTypeException
+            raise
+    finally:
+        # Оригинал не хранится
+        await run_in_threadpool(remove_public_file, original_url)
+    return variant_urls(sha256, kind)[-1]
+
+
+async def release_image(url: str | None) -> None:
+    if url is None:
+        return
+    async with async_session() as session:
+        released = await release_blob(session, url)
+        in_use = None
+        if not released:
+            # Загрузки до хранилища лежат в отдельных файлах без счётчика ссылок. Одинаковые картинки
+            # разных пользователей лежат в одних файлах, поэтому используемые не удаляются
+            in_use = await session.scalar(
+                select(MUser.id).where(or_(MUser.avatar_url == url, MUser.background_url == url)).limit(1)
+            )
+        await session.commit()
+    if released or in_use is not None:
+        return
+
+    if not VARIANT_PATTERN.search(url):
+        await run_in_threadpool(remove_public_file, url)
+        return
+    for size in VARIANTS.get(url.split("/")[0], ()):
+        await run_in_threadpool(remove_public_file, image_variant(url, size))
+
+
+async def run_blob_gc() -> None:
+    while True:
+        await asyncio.sleep(settings.BLOB_GC_INTERVAL_SECONDS)
+        try:
+            await collect_blobs(remove_blob_files, settings.BLOB_GC_GRACE_SECONDS)
+        except (SQLAlchemyError, OSError):
+            logger.exception("Blob garbage collection failed")
@@ -2,10 +2,10 @@ import datetime
 
 from fastapi import APIRouter
 from fastapi.params import Depends
-from sqlalchemy import delete
 
 from app.db.base import async_session
-from app.models.like import Like as MLike
+from app.db.likes import write_likes, invalidate_likes, like_buffer
+from app.settings import settings
 
 from app.security.dependencies import get_current_user_id
 
@@ -19,25 +19,28 @@ router = APIRouter(
 async def like_shader(shader_id: int, user_id: int = Depends(get_current_user_id)):
     print(shader_id, user_id)
     # TODO в идеале сделать логическое удаление, но пока обойдусь и нет поля для сохранения статуса лайка в модели
-    async with async_session() as session:
-        like = MLike(
-            created_at=datetime.datetime.now(datetime.UTC).replace(tzinfo=None),
-            user_id=user_id,
-            shader_id=shader_id
-        )
-        session.add(like)
-        await session.commit()
-        return like
+    created_at = datetime.datetime.now(datetime.UTC).replace(tzinfo=None)
+    if settings.LIKE_BUFFER_ENABLED:
+        like_buffer.add(user_id, shader_id, created_at)
+    else:
+        # Повторный лайк ничего не меняет благодаря уникальному ограничению
+        async with async_session() as session:
+            deltas = await write_likes(session, [(user_id, shader_id, created_at)], [])
+            await session.commit()
+        await invalidate_likes(deltas)
+
+    return {"created_at": created_at, "user_id": user_id, "shader_id": shader_id}
 
 
 @router.delete("/{shader_id}")
 async def unlike_shader(shader_id: int, user_id: int = Depends(get_current_user_id)):
     print(shader_id, user_id)
 
-    async with async_session() as session:
-        await session.execute(
-            delete(MLike)
-            .where((MLike.shader_id == shader_id) & (MLike.user_id == user_id))
-        )
-        await session.commit()
-        return
+    if settings.LIKE_BUFFER_ENABLED:
+        like_buffer.add(user_id, shader_id, None)
+    else:
+        async with async_session() as session:
+            deltas = await write_likes(session, [], [(user_id, shader_id)])
+            await session.commit()
+        await invalidate_likes(deltas)
+    return
@@ -0,0 +1,33 @@
+from fastapi import APIRouter, Depends
+
+from app.api.images import images
+from app.api.streaming import streams
+from app.cache.base import cache
+from app.db.base import engine
+from app.db.likes import like_buffer
+from app.db.replicas import replicas
+from app.security.dependencies import get_current_admin
+from app.security.hashing import hashing
+from app.security.tokens import token_cache
+
+# Метрики раскрывают устройство пулов и адреса реплик, поэтому доступны только администраторам
+router = APIRouter(
+    prefix="/metrics",
+    tags=["metrics"],
+    dependencies=[Depends(get_current_admin)],
+)
+
+
+@router.get("/")
+async def get_metrics():
+    # Метрики текущего воркера
+    return {
+        "db_pool": engine.pool.metrics(),
+        "db_replicas": replicas.metrics(),
+        "like_buffer": like_buffer.metrics(),
+        "cache": cache.stats(),
+        "password_hashing": hashing.metrics(),
+        "image_processing": images.metrics(),
+        "token_cache": token_cache.stats(),
+        "ndjson_streams": streams.metrics(),
+    }
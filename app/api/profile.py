@@ -1,256 +1,298 @@
-import os
-import pathlib
-import shutil
-import uuid
+import asyncio
+import datetime
 
-from fastapi import APIRouter, Request, Response, UploadFile, Depends
+from fastapi import APIRouter, Request, UploadFile, Depends
 from fastapi.params import Query
-from sqlalchemy import literal_column, union_all, literal, func
-from sqlalchemy import select
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import func, true, literal_column
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy import select, update
 from sqlalchemy.orm import aliased
 
+from app.api.conditional import make_etag, is_not_modified, not_modified, set_validators
+from app.api.streaming import wants_ndjson, ndjson_response
+from app.api.images import (store_image,
+                            release_image,
+                            image_variant,
+                            AVATAR_PROFILE_SIZE,
+                            BACKGROUND_SIZE)
 from app.db.base import async_session
+from app.db.pagination import encode_cursor, decode_cursor, keyset_condition
+from app.db.replicas import read_session
 from app.exceptions import UserNotExistsException
-from app.models.comment import Comment as MComment
-from app.models.like import Like as MLike
+from app.models.activity import Activity as MActivity
 from app.models.shader import Shader as MShader
 from app.models.user import User as MUser
+from app.models.user_stats import UserStats as MUserStats
 from app.schemas.user.update_biography import UpdateBiography
 from app.security.dependencies import get_current_user, get_current_user_id
+from app.security.users import invalidate_user
 
 router = APIRouter(
     prefix="/profile",
     tags=["profile"],
 )
 
+ACTIVITIES_PAGE_SIZE = 20
+ACTIVITIES_CURSOR = "activities"
+
+
+def profile_summary(user_id: int, activity_page: int = 1):
+    # Данные пользователя, агрегаты по его шейдерам и счётчики из user_stats одним запросом, заодно это версия профиля для ETag.
+    # Счётчики берутся по каждому шейдеру: в user_stats лайк одного и снятие лайка с другого взаимно гасятся.
+    # Названия родителей форков и шейдеров из ленты встроены в ответ, поэтому в версии и их правки
+    MForkedShader = aliased(MShader)
+    shaders = (
+        select(func.count(MShader.id).label("shaders_count"),
+               func.max(MShader.updated_at).label("shaders_updated_at"),
+               func.md5(func.string_agg(
+                   func.concat_ws(":", MShader.id, MShader.likes_count, MShader.comments_count, MShader.forks_count),
+                   aggregate_order_by(literal_column("','"), MShader.id)
+               )).label("shaders_counters"),
+               func.max(MForkedShader.updated_at).label("forked_updated_at"))
+        .outerjoin(MForkedShader, MShader.id_forked == MForkedShader.id)
+        .where(MShader.user_id == user_id)
+        .subquery()
+    )
+    activities = (
+        select(func.count(MActivity.id).label("activities_count"), func.max(MActivity.id).label("last_activity_id"))
+        .where(MActivity.user_id == user_id)
+        .subquery()
+    )
+    page = (
+        activities_query(user_id)
+        .limit(ACTIVITIES_PAGE_SIZE)
+        .offset((activity_page - 1) * ACTIVITIES_PAGE_SIZE)
+        .subquery()
+    )
+    activity_shaders_updated_at = (
+        select(func.max(MShader.updated_at))
+        .where(MShader.id.in_(select(page.c.shader_id)))
+        .scalar_subquery()
+    )
+    return (
+        select(MUser.id, MUser.email, MUser.name, MUser.biography, MUser.avatar_url, MUser.background_url,
+               MUser.created_at, *shaders.c,
+               func.coalesce(MUserStats.likes_received, 0).label("total_likes"),
+               func.coalesce(MUserStats.comments_received, 0).label("total_comments"),
+               func.coalesce(MUserStats.forks_received, 0).label("total_forks"),
+               *activities.c,
+               activity_shaders_updated_at.label("activity_shaders_updated_at"))
+        .select_from(MUser)
+        .join(shaders, true())
+        .outerjoin(MUserStats, MUserStats.user_id == MUser.id)
+        .join(activities, true())
+        .where(MUser.id == user_id)
+    )
+
 
 @router.get("/{user_id}")
 async def get_profile_by_id(
         user_id: int,
-        response: Response,
         request: Request,
         activity_page: int = Query(default=1, ge=1)):
-    # TODO переделать через один запрос в БД
     # TODO добавить возвращаемые значения
 
-    # Получение информации о пользователе
-    async with async_session() as session:
-        result = await session.execute(
-            select(MUser)
-            .where(MUser.id == int(user_id))
-        )
-        user = result.scalars().first()
+    is_owner = await is_profile_owner(request, user_id)
 
-    if not user:
+    # Получение информации о пользователе
+    async with read_session() as session:
+        summary = (await session.execute(profile_summary(user_id, activity_page))).mappings().first()
+    if summary is None:
         raise UserNotExistsException
 
-    # Получение списка активностей пользователя (лайков, комментариев и forked шейдеров)
-    activities = []
+    etag = make_etag(is_owner, activity_page, *summary.values())
+    if is_not_modified(request, etag):
+        return not_modified(etag)
 
-    like_query = (
-        select(MShader.id, MShader.title, MLike.created_at, literal("like").label("like"))
-        .join(MLike, MShader.id == MLike.shader_id)
-        .where(MLike.user_id == int(user_id))
+    # Списки не зависят друг от друга и читаются одновременно на разных соединениях
+    (activities, next_cursor), shaders = await asyncio.gather(
+        fetch_activities(user_id, ACTIVITIES_PAGE_SIZE, activity_page),
+        fetch_profile_shaders(user_id, is_owner)
     )
 
-    comment_query = (
-        select(MShader.id, MShader.title, MComment.created_at, literal("comment").label("comment"))
-        .join(MComment, MShader.id == MComment.shader_id)
-        .where(MComment.user_id == int(user_id))
-    )
+    user_data = {
+        "id": summary["id"],
+        "email": summary["email"],
+        "name": summary["name"],
+        "biography": summary["biography"],
+        "avatar_url": image_variant(summary["avatar_url"], AVATAR_PROFILE_SIZE),
+        "background_url": image_variant(summary["background_url"], BACKGROUND_SIZE),
+        "created_at": summary["created_at"],
+        "shaders": shaders,
+        "activities": activities,
+        "total_likes": summary["total_likes"],
+        "total_comments": summary["total_comments"],
+        "total_forks": summary["total_forks"]
+    }
 
-    forked_query = (
-        select(MShader.id, MShader.title, MShader.created_at, literal("fork").label("fork"))
-        .where((MShader.id_forked != None) & (MShader.user_id == int(user_id)))
+    # Словарь сразу уходит в orjson, минуя jsonable_encoder
+    response = ORJSONResponse(user_data)
+    response.headers["X-Total-Count"] = str(summary["activities_count"])
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
+    set_validators(response, etag)
+    return response
+
+
+async def is_profile_owner(request: Request, user_id: int) -> bool:
+    if request.cookies.get("access_token") is None:
+        return False
+    return await get_current_user_id(request) == user_id
+
+
+def activities_query(user_id: int, cursor: str | None = None):
+    # Лента читается по индексу (user_id, created_at, id) без сортировки всей истории
+    query = (
+        select(MActivity.id,
+               MActivity.shader_id,
+               MShader.title.label("shader_title"),
+               MActivity.created_at,
+               MActivity.type)
+        .join(MShader, MActivity.shader_id == MShader.id)
+        .where(MActivity.user_id == user_id)
+        .order_by(MActivity.created_at.desc(), MActivity.id.desc())
     )
+    if cursor is not None:
+        last = decode_cursor(cursor, ACTIVITIES_CURSOR, datetime.datetime.fromisoformat)
+        query = query.where(keyset_condition([MActivity.created_at, MActivity.id], last))
+    return query
+
+
+def activity_json(row) -> dict:
+    return {
+        "shader_id": row["shader_id"],
+        "shader_title": row["shader_title"],
+        "action_created_at": row["created_at"],
+        "type": row["type"]
+    }
 
-    activity_query = union_all(like_query, comment_query, forked_query)
-    async with async_session() as session:
-        result = await session.execute(
-            activity_query
-            .order_by(literal_column("created_at").desc())
-        )
-        all_result = result.all()
-        response.headers["X-Total-Count"] = str(len(all_result))
-        for shader_id, shader_title, action_created, activity_type in all_result[:20]:
-            activities.append({
-                "shader_id": shader_id,
-                "shader_title": shader_title,
-                "action_created_at": action_created,
-                "type": activity_type
-            })
 
+async def fetch_activities(user_id: int, limit: int, page: int = 1, cursor: str | None = None) -> tuple[list, str | None]:
+    query = activities_query(user_id, cursor).limit(limit)
+    if cursor is None:
+        # Старые клиенты передают номер страницы
+        query = query.offset((page - 1) * limit)
+
+    async with read_session() as session:
+        rows = (await session.execute(query)).mappings().all()
+
+    next_cursor = None
+    if len(rows) == limit:
+        next_cursor = encode_cursor(ACTIVITIES_CURSOR, rows[-1]["created_at"], rows[-1]["id"])
+    return [activity_json(row) for row in rows], next_cursor
+
+
+def profile_shaders_query(user_id: int, is_owner: bool):
     # Получение списка всех шейдеров пользователя
     condition = (MShader.user_id == int(user_id)) & (MShader.visibility == True)
 
-    if request.cookies.get("access_token") is not None:
-        auth_user_id = await get_current_user_id(request)
-
-        if auth_user_id == user_id:
-            condition = MShader.user_id == int(user_id)
+    if is_owner:
+        condition = MShader.user_id == int(user_id)
 
+    # Карточки шейдеров без исходного кода, от родительского шейдера нужны только id и название
     MForkedShader = aliased(MShader)
-    async with async_session() as session:
-        result = await session.execute(
-            select(MShader, MForkedShader)
-            .outerjoin(MForkedShader, MShader.id_forked == MForkedShader.id)
-            .where(condition)
-            .order_by(MShader.created_at.desc())
-        )
-        shaders = []
-        for shader, forked_shader in result.all():
-            shader.forked_shader = forked_shader
-            shaders.append(shader)
-
-    # Объединённый запрос для подсчёта лайков, комментариев и форков на шейдерах пользователя
-    async with async_session() as session:
-        subquery_user_shaders = select(MShader.id).where(MShader.user_id == int(user_id)).subquery()
-
-        result = await session.execute(
-            select(
-                # Подсчёт лайков
-                select(func.count(MLike.id))
-                .join_from(MLike, MShader, MLike.shader_id == MShader.id)
-                .where(MShader.user_id == int(user_id))
-                .scalar_subquery()
-                .label("likes_received"),
-
-                # Подсчёт комментариев
-                select(func.count(MComment.id))
-                .join_from(MComment, MShader, MComment.shader_id == MShader.id)
-                .where(MShader.user_id == int(user_id))
-                .scalar_subquery()
-                .label("comments_received"),
-
-                # Подсчёт форков
-                select(func.count(MShader.id))
-                .where(MShader.id_forked != None)
-                .where(MShader.id_forked.in_(select(subquery_user_shaders.c.id)))
-                .scalar_subquery()
-                .label("forks_received")
-            )
-        )
-
-        total_likes, total_comments, total_forks = result.one()
+    return (
+        select(MShader.id,
+               MShader.title,
+               MShader.description,
+               MShader.visibility,
+               MShader.created_at,
+               MShader.updated_at,
+               MShader.user_id,
+               MShader.id_forked,
+               MShader.likes_count,
+               MShader.comments_count,
+               MShader.forks_count,
+               MForkedShader.title.label("forked_title"),
+               MForkedShader.user_id.label("forked_user_id"))
+        .outerjoin(MForkedShader, MShader.id_forked == MForkedShader.id)
+        .where(condition)
+        .order_by(MShader.created_at.desc())
+    )
 
-    user_data = {
-        "id": user.id,
-        "email": user.email,
-        "name": user.name,
-        "biography": user.biography,
-        "avatar_url": user.avatar_url,
-        "background_url": user.background_url,
-        "created_at": user.created_at,
-        "shaders": shaders,
-        "activities": activities,
-        "total_likes": total_likes,
-        "total_comments": total_comments,
-        "total_forks": total_forks
+
+def profile_shader_json(row) -> dict:
+    shader = dict(row)
+    forked_title = shader.pop("forked_title")
+    forked_user_id = shader.pop("forked_user_id")
+    shader["forked_shader"] = None if forked_user_id is None else {
+        "id": shader["id_forked"],
+        "title": forked_title,
+        "user_id": forked_user_id
     }
+    return shader
+
 
-    return user_data
+async def fetch_profile_shaders(user_id: int, is_owner: bool) -> list:
+    async with read_session() as session:
+        result = await session.execute(profile_shaders_query(user_id, is_owner))
+        return [profile_shader_json(row) for row in result.mappings()]
+
+
+@router.get("/{profile_id}/shaders")
+async def get_profile_shaders(profile_id: int, request: Request):
+    is_owner = await is_profile_owner(request, profile_id)
+    if wants_ndjson(request):
+        return await ndjson_response(request, profile_shaders_query(profile_id, is_owner), profile_shader_json)
+    return ORJSONResponse(await fetch_profile_shaders(profile_id, is_owner))
 
 
 @router.get("/{profile_id}/activities")
 async def get_activities(
-        response: Response,
-        user_id: int = Depends(get_current_user_id),
+        profile_id: int,
+        request: Request,
         activity_page: int = Query(default=1, ge=1),
-        limit: int = Query(default=20, ge=1)
+        limit: int = Query(default=20, ge=1, le=100),
+        cursor: str | None = Query(default=None)
 ):
     # Получение списка активностей пользователя (лайков, комментариев и forked шейдеров)
-    activities = []
-
-    like_query = (
-        select(MShader.id, MShader.title, MLike.created_at, literal("like").label("like"))
-        .join(MLike, MShader.id == MLike.shader_id)
-        .where(MLike.user_id == int(user_id))
-    )
-
-    comment_query = (
-        select(MShader.id, MShader.title, MComment.created_at, literal("comment").label("comment"))
-        .join(MComment, MShader.id == MComment.shader_id)
-        .where(MComment.user_id == int(user_id))
-    )
-
-    forked_query = (
-        select(MShader.id, MShader.title, MShader.created_at, literal("fork").label("fork"))
-        .where((MShader.id_forked != None) & (MShader.user_id == int(user_id)))
-    )
-
-    activity_query = union_all(like_query, comment_query, forked_query)
-    async with async_session() as session:
-        result = await session.execute(
-            activity_query
-            .offset((activity_page - 1) * limit)
-            .limit(activity_page * limit)
-            .order_by(literal_column("created_at").desc())
-        )
-        for shader_id, shader_title, action_created, activity_type in result:
-            activities.append({
-                "shader_id": shader_id,
-                "shader_title": shader_title,
-                "action_created_at": action_created,
-                "type": activity_type
-            })
-    return activities
+    if wants_ndjson(request):
+        # Вся лента потоком, начиная с курсора, если он передан
+        return await ndjson_response(request, activities_query(profile_id, cursor), activity_json)
+
+    activities, next_cursor = await fetch_activities(profile_id, limit, activity_page, cursor)
+    response = ORJSONResponse(activities)
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return response
+
+
+async def set_user_image(user_id: int, field: str, url: str | None) -> None:
+    # Старое значение читается под блокировкой строки, а не из кэша пользователя,
+    # чтобы ссылка на прежнее изображение точно была снята один раз
+    column = getattr(MUser, field)
+    try:
+        async with async_session() as session:
+            old_url = await session.scalar(select(column).where(MUser.id == user_id).with_for_update())
+            await session.execute(update(MUser).where(MUser.id == user_id).values({field: url}))
+            await session.commit()
+    except BaseException:
+        if url is not None:
+            await release_image(url)
+        raise
+
+    await invalidate_user(user_id)
+    await release_image(old_url)
 
 
 @router.post("/avatar")
 async def upload_avatar(avatar: UploadFile, user: MUser = Depends(get_current_user)):
-    # Удаляем старый аватар
-    if user.avatar_url and os.path.exists(f"public/{user.avatar_url}"):
-        os.remove(f"public/{user.avatar_url}")
-
-    # Сохраняем новый
-    avatar_url = f"avatars/{uuid.uuid4().hex}{pathlib.Path(avatar.filename).suffix}"
-    with open(f"public/{avatar_url}", "wb+") as f:
-        shutil.copyfileobj(avatar.file, f)
-
-    # Обновляем информацию в БД
-    async with async_session() as session:
-        user.avatar_url = avatar_url
-        session.add(user)
-        await session.commit()
-        await session.refresh(user)
-
+    avatar_url = await store_image(avatar, "avatars")
+    await set_user_image(user.id, "avatar_url", avatar_url)
     return {"avatar_url": avatar_url}
 
 
 @router.post("/background")
 async def upload_background(background: UploadFile, user: MUser = Depends(get_current_user)):
-    # Удаляем старый аватар
-    if user.background_url and os.path.exists(f"public/{user.background_url}"):
-        os.remove(f"public/{user.background_url}")
-
-    # Сохраняем новый
-    background_url = f"backgrounds/{uuid.uuid4().hex}{pathlib.Path(background.filename).suffix}"
-    with open(f"public/{background_url}", "wb+") as f:
-        shutil.copyfileobj(background.file, f)
-
-    # Обновляем информацию в БД
-    async with async_session() as session:
-        user.background_url = background_url
-        session.add(user)
-        await session.commit()
-        await session.refresh(user)
-
+    background_url = await store_image(background, "backgrounds")
+    await set_user_image(user.id, "background_url", background_url)
     return {"background_url": background_url}
 
 
 @router.delete("/background")
 async def delete_background(user: MUser = Depends(get_current_user)):
-    # Удаляем старый аватар
-    if user.background_url and os.path.exists(f"public/{user.background_url}"):
-        os.remove(f"public/{user.background_url}")
-
-    # Обновляем информацию в БД
-    async with async_session() as session:
-        user.background_url = None
-        session.add(user)
-        await session.commit()
-        await session.refresh(user)
-
+    await set_user_image(user.id, "background_url", None)
     return
 
 
@@ -261,4 +303,6 @@ async def update_biography(body: UpdateBiography, user: MUser = Depends(get_curr
         session.add(user)
         await session.commit()
         await session.refresh(user)
-        return
+
+    await invalidate_user(user.id)
+    return
@@ -1,191 +1,361 @@
 import datetime
+from functools import partial
+from typing import NamedTuple
 
 from fastapi.encoders import jsonable_encoder
-from sqlalchemy import func, distinct
+from sqlalchemy import func, case, cast, exists, null, literal_column, Text
 from fastapi import APIRouter, HTTPException, Request, status
 from fastapi.params import Depends, Query
-from sqlalchemy import select
+from sqlalchemy import select, update
 from sqlalchemy.dialects.mysql.base import MSSet
+from sqlalchemy.dialects.postgresql import aggregate_order_by
 from sqlalchemy.orm import aliased
-from starlette.responses import Response, JSONResponse
+from pydantic import TypeAdapter
+from starlette.responses import Response
 
+from app.cache.base import (cache,
+                            GALLERY_NAMESPACE,
+                            gallery_key,
+                            gallery_total_key,
+                            shader_key,
+                            comments_key,
+                            invalidate_gallery)
+from app.api.comments import authors_version
+from app.api.conditional import make_etag, has_validators, is_not_modified, not_modified, set_validators
+from app.api.images import image_variant_sql, AVATAR_LIST_SIZE
+from app.api.streaming import wants_ndjson, ndjson_response
 from app.db.base import async_session
+from app.db.replicas import read_session, prefer_primary
+from app.db.pagination import encode_cursor, decode_cursor, keyset_condition, cursor_expression
+from app.db.user_stats import change_user_stats
+from app.models.activity import Activity as MActivity
 from app.models.like import Like as MLike
 from app.models.comment import Comment as MComment
 from app.models.shader import Shader as MShader
 from app.models.user import User as MUser
+from app.schemas.shader.shader_card import ShaderCard
 from app.schemas.shader.shader_in import ShaderIn
 from app.schemas.shader.shader_out import ShaderOut
 from app.security.dependencies import get_current_user_id
+from app.settings import settings
 
 router = APIRouter(
     prefix="/shaders",
     tags=["shaders"],
 )
 
+PAGE_SIZE = 12
+MAX_CODE_IDS = 50
+SHADER_CARDS = TypeAdapter(list[ShaderCard])
 
-@router.get("/")
+
+@router.get("/", response_model=list[ShaderCard])
 async def get_all_visible_shaders(
-        response: Response,
+        request: Request,
         page: int = Query(default=1, ge=1),
-        sort: str = Query(default="Newest")
+        sort: str = Query(default="Newest"),
+        cursor: str | None = Query(default=None)
 ):
     match sort:
         case 'Liked':
-            sort_option = func.count(distinct(MLike.id)).desc()
+            sort_column, value_type = MShader.likes_count, int
         case 'Commented':
-            sort_option = func.count(distinct(MComment.id)).desc()
+            sort_column, value_type = MShader.comments_count, int
         case _:  # 'Newest'
-            sort_option = MShader.created_at.desc()
+            sort = 'Newest'
+            sort_column, value_type = MShader.created_at, datetime.datetime.fromisoformat
+
+    if wants_ndjson(request):
+        # Выгрузка всей галереи потоком, начиная с курсора, если он передан
+        query = gallery_query(sort_column)
+        if cursor is not None:
+            query = query.where(keyset_condition([sort_column, MShader.id], decode_cursor(cursor, sort, value_type)))
+        return await ndjson_response(request, query, gallery_card)
+
+    fetch_page = partial(fetch_gallery_page, sort, sort_column, value_type, page, cursor)
+    if prefer_primary.get():
+        # Клиент только что писал: читаем мимо кэша, чтобы он сразу увидел свои изменения
+        cached, total = await fetch_page(), await fetch_gallery_total()
+    else:
+        # Страница и общее число шейдеров читаются из кэша одним запросом
+        version = await cache.get_version(GALLERY_NAMESPACE)
+        page_key, total_key = gallery_key(version, sort, page, cursor), gallery_total_key(version)
+        cached, total = await cache.get_many([page_key, total_key])
+        if cached is None:
+            cached = await cache.get_or_set(page_key, fetch_page)
+        if total is None:
+            total = await cache.get_or_set(total_key, fetch_gallery_total)
+
+    # Страница хранится в кэше уже сериализованной и отдаётся как есть
+    body, next_cursor = cached
+    response = Response(content=body, media_type="application/json")
+    response.headers["X-Total-Count"] = str((total - 1) // PAGE_SIZE + 1)
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return response
+
+
+def gallery_query(sort_column):
+    return (
+        select(MShader.id,
+               MShader.title,
+               MShader.user_id,
+               MUser.name.label("username"),
+               MShader.likes_count.label("likes"),
+               MShader.comments_count.label("comments"),
+               sort_column.label("sort_value"))
+        .join(MUser, MShader.user_id == MUser.id)
+        .where(MShader.visibility == True)
+        .order_by(sort_column.desc(), MShader.id.desc())
+    )
+
 
+def gallery_card(row) -> dict:
+    return {key: value for key, value in row.items() if key != "sort_value"}
+
+
+async def fetch_gallery_page(sort: str, sort_column, value_type, page: int, cursor: str | None):
+    # Keyset-пагинация: id разрешает равенство значений сортировки
+    query = gallery_query(sort_column).limit(PAGE_SIZE)
+    if cursor is not None:
+        query = query.where(keyset_condition([sort_column, MShader.id], decode_cursor(cursor, sort, value_type)))
+    else:
+        # Старые клиенты передают номер страницы
+        query = query.offset((page - 1) * PAGE_SIZE)
+
+    # Страница читается только для заполнения кэша или сразу после записи, поэтому из основной базы:
+    # отстающая реплика вернула бы в общий кэш данные до записи, и они пережили бы cookie read_primary
     async with async_session() as session:
-        result = await session.execute(
-            select(MShader.id,
-                   MShader.title,
-                   MShader.code,
-                   MShader.user_id,
-                   MUser.name.label("username"),
-                   func.count(distinct(MLike.id)).label("likes"),
-                   func.count(distinct(MComment.id)).label("comments"))
-            .join(MUser, MShader.user_id == MUser.id)
-            .outerjoin(MLike, MShader.id == MLike.shader_id)
-            .outerjoin(MComment, MShader.id == MComment.shader_id)
+        result = await session.execute(query)
+        rows = result.mappings().all()
+
+    next_cursor = None
+    if len(rows) == PAGE_SIZE:
+        next_cursor = encode_cursor(sort, rows[-1]["sort_value"], rows[-1]["id"])
+
+    # Проверка по модели один раз при заполнении кэша
+    cards = SHADER_CARDS.validate_python([gallery_card(row) for row in rows])
+    return SHADER_CARDS.dump_json(cards).decode(), next_cursor
+
+
+async def fetch_gallery_total() -> int:
+    async with async_session() as session:
+        return await session.scalar(
+            select(func.count(MShader.id))
             .where(MShader.visibility == True)
-            .group_by(MShader.id, MUser.name)
-            .order_by(sort_option)
         )
-        shaders = result.mappings().all()
-        response.headers["X-Total-Count"] = str((len(shaders) - 1) // 12 + 1)
-        return shaders[(page - 1) * 12: page * 12]
+
+
+@router.get("/code")
+async def get_shaders_code(request: Request, ids: list[int] = Query(max_length=MAX_CODE_IDS)):
+    # Исходный код для карточек галереи запрашивается отдельно и только для видимых на экране
+    condition = MShader.visibility == True
+    if request.cookies.get("access_token") is not None:
+        user_id: int = await get_current_user_id(request)
+        condition = condition | (MShader.user_id == user_id)
+
+    async with read_session() as session:
+        result = await session.execute(
+            select(MShader.id, MShader.code)
+            .where(MShader.id.in_(ids) & condition)
+        )
+        return {shader_id: code for shader_id, code in result.all()}
+
+
+def shader_json(shader):
+    return func.json_build_object(
+        "id", shader.id,
+        "title", shader.title,
+        "description", shader.description,
+        "code", shader.code,
+        "visibility", shader.visibility,
+        "created_at", shader.created_at,
+        "updated_at", shader.updated_at,
+        "user_id", shader.user_id,
+        "id_forked", shader.id_forked
+    )
+
+
+class ShaderDetail(NamedTuple):
+    visibility: bool
+    user_id: int
+    etag: str
+    payload: str
+
+
+def check_shader_access(row, user_id: int | None):
+    if row is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Shader not found")
+
+    if not row.visibility and row.user_id != user_id:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
+                            detail="User is not the owner of the shader")
+    return row
 
 
 @router.get("/{shader_id}/")
 async def get_shader_by_id(shader_id: int, request: Request):
-    print(f"Получаю шейдер {shader_id}")
-    response_data = None
-    if request.cookies.get("access_token") is None:
-        MForkedShader = aliased(MShader)
-        async with async_session() as session:
+    user_id = None
+    if request.cookies.get("access_token") is not None:
+        user_id = await get_current_user_id(request)
+
+    # Анонимный вариант ответа одинаков для всех и берётся из кэша.
+    # После записи клиент читает основную базу мимо кэша
+    cacheable = user_id is None and not prefer_primary.get()
+    if cacheable:
+        cached = await cache.get(shader_key(shader_id))
+        if cached is not None:
+            return shader_response(request, check_shader_access(ShaderDetail(*cached), user_id))
+
+    if has_validators(request):
+        # Сначала дешёвая проверка версии, payload строится только если он изменился
+        async with read_session() as session:
             result = await session.execute(
-                select(MShader, MUser.name.label("username"), MForkedShader)
-                .join(MUser, MShader.user_id == MUser.id)
-                .outerjoin(MForkedShader, MShader.id_forked == MForkedShader.id)
+                select(MShader.visibility, MShader.user_id, *shader_version(user_id))
                 .where(MShader.id == shader_id)
             )
+        row = check_shader_access(result.first(), user_id)
+        etag = make_etag(user_id, *row[2:])
+        if is_not_modified(request, etag):
+            return not_modified(etag)
 
-            result = result.first()
-            if result is None:
-                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Shader not found")
-
-            shader, username, forked_shader = result
-            print(shader)
-            response_data = {
-                "shader": {
-                    "id": shader.id,
-                    "title": shader.title,
-                    "description": shader.description,
-                    "code": shader.code,
-                    "visibility": shader.visibility,
-                    "created_at": shader.created_at.isoformat(),
-                    "updated_at": shader.updated_at.isoformat(),
-                    "user_id": shader.user_id,
-                    "id_forked": shader.id_forked
-                },
-                "is_liked": None,
-                "username": username,
-                "forked_shader": None if forked_shader is None else {
-                    "id": forked_shader.id,
-                    "title": forked_shader.title,
-                    "description": forked_shader.description,
-                    "code": forked_shader.code,
-                    "visibility": forked_shader.visibility,
-                    "created_at": forked_shader.created_at.isoformat(),
-                    "updated_at": forked_shader.updated_at.isoformat(),
-                    "user_id": forked_shader.user_id,
-                    "id_forked": forked_shader.id_forked
-                }
-            }
-
+    if cacheable:
+        # Кэш заполняется из основной базы, иначе отстающая реплика положила бы в него ответ до записи
+        detail = ShaderDetail(*await cache.get_or_set(shader_key(shader_id),
+                                                      partial(fetch_shader_detail, async_session, shader_id, user_id)))
     else:
-        user_id: int = await get_current_user_id(request)
-        MForkedShader = aliased(MShader)
+        detail = await fetch_shader_detail(read_session, shader_id, user_id)
 
-        async with async_session() as session:
-            result = await session.execute(
-                select(MShader, MLike.id.label("is_liked"), MUser.name.label("username"), MForkedShader)
-                .join(MUser, MShader.user_id == MUser.id)
-                .outerjoin(MForkedShader, MShader.id_forked == MForkedShader.id)
-                .outerjoin(MLike, (MLike.shader_id == MShader.id) & (MLike.user_id == user_id))
-                .where(MShader.id == shader_id)
-            )
+    return shader_response(request, check_shader_access(detail, user_id))
 
-            result = result.first()
-            if result is None:
-                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Shader not found")
-            shader, is_liked, username, forked_shader = result
-            print(shader)
 
-            if shader is None:
-                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Shader not found")
-
-            if not shader.visibility:
-                if shader.user_id != user_id:
-                    raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
-                                        detail="User is not the owner of the shader")
-
-        response_data = {
-            "shader": {
-                "id": shader.id,
-                "title": shader.title,
-                "description": shader.description,
-                "code": shader.code,
-                "visibility": shader.visibility,
-                "created_at": shader.created_at.isoformat(),
-                "updated_at": shader.updated_at.isoformat(),
-                "user_id": shader.user_id,
-                "id_forked": shader.id_forked
-            },
-            "is_liked": is_liked is not None,
-            "username": username,
-            "forked_shader": None if forked_shader is None else {
-                "id": forked_shader.id,
-                "title": forked_shader.title,
-                "description": forked_shader.description,
-                "code": forked_shader.code,
-                "visibility": forked_shader.visibility,
-                "created_at": forked_shader.created_at.isoformat(),
-                "updated_at": forked_shader.updated_at.isoformat(),
-                "user_id": forked_shader.user_id,
-                "id_forked": forked_shader.id_forked
-            }
-        }
+def is_liked_by(user_id: int):
+    return (
+        exists()
+        .where((MLike.shader_id == MShader.id) & (MLike.user_id == user_id))
+        .correlate(MShader)
+    )
 
-    async with async_session() as session:
-        result = await session.execute(
-            select(MComment, MUser.name.label("username"), MUser.avatar_url.label("avatar_url"))
-            .join(MUser, MComment.user_id == MUser.id)
-            .where(MComment.shader_id == shader_id)
-            .order_by(MComment.created_at.desc())
+
+def shader_version(user_id: int | None) -> list:
+    # Версия шейдера для ETag: правки, лайки, состояние комментариев и лайк самого зрителя,
+    # а также правки встроенного родителя форка и авторов первой страницы комментариев.
+    # Last-Modified не отдаётся: updated_at не меняется от лайков и комментариев
+    MForkedShader = aliased(MShader)
+    first_page = (
+        select(MComment.id, MComment.user_id, MUser.name.label("username"), MUser.avatar_url)
+        .join(MUser, MComment.user_id == MUser.id)
+        .where(MComment.shader_id == MShader.id)
+        .order_by(MComment.created_at.desc(), MComment.id.desc())
+        .limit(settings.COMMENTS_PAGE_SIZE)
+        .correlate(MShader)
+        .subquery()
+    )
+    version = [
+        MShader.updated_at,
+        MShader.likes_count,
+        MShader.comments_count,
+        select(func.max(MComment.id))
+        .where(MComment.shader_id == MShader.id)
+        .correlate(MShader)
+        .scalar_subquery(),
+        select(func.count(MComment.id))
+        .where((MComment.shader_id == MShader.id) & MComment.hidden)
+        .correlate(MShader)
+        .scalar_subquery(),
+        select(MForkedShader.updated_at)
+        .where(MForkedShader.id == MShader.id_forked)
+        .correlate(MShader)
+        .scalar_subquery(),
+        authors_version(first_page)
+    ]
+    if user_id is not None:
+        version.append(is_liked_by(user_id))
+    return version
+
+
+async def fetch_shader_detail(make_session, shader_id: int, user_id: int | None) -> ShaderDetail:
+    # Весь ответ собирается в Postgres одним запросом и отдаётся без разбора в ORM
+    async with make_session() as session:
+        result = await session.execute(shader_detail_query(shader_id, user_id))
+    row = result.first()
+    if row is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Shader not found")
+
+    return ShaderDetail(row.visibility, row.user_id, make_etag(user_id, *row[2:-1]), row.payload)
+
+
+def shader_detail_query(shader_id: int, user_id: int | None):
+    is_liked = null() if user_id is None else is_liked_by(user_id)
+
+    # Только первая страница комментариев, остальные через /comments/{shader_id}?order=desc&cursor=
+    page = (
+        select(
+            MComment.created_at,
+            MComment.id,
+            func.row_number().over(order_by=(MComment.created_at.desc(), MComment.id.desc())).label("position"),
+            func.json_build_object(
+                "id", MComment.id,
+                "text", case((MComment.hidden, "Hidden"), else_=MComment.text),
+                "hidden", MComment.hidden,
+                "created_at", MComment.created_at,
+                "user_id", MComment.user_id,
+                "shader_id", MComment.shader_id,
+                "username", MUser.name,
+                "avatar_url", image_variant_sql(MUser.avatar_url, AVATAR_LIST_SIZE)
+            ).label("comment")
         )
-        rows = result.all()
-        comments = []
-        for comment, username, avatar_url in rows:
-            comments.append({
-                "id": comment.id,
-                "text": comment.text if not comment.hidden else "Hidden",
-                "hidden": comment.hidden,
-                "created_at": comment.created_at.isoformat(),
-                "user_id": comment.user_id,
-                "shader_id": comment.shader_id,
-                "username": username,
-                "avatar_url": avatar_url,
-            })
-    response_data["comments"] = comments
-    print(response_data)
-    return JSONResponse(content=response_data, media_type="application/json")
-
-
-@router.post("/")
+        .join(MUser, MComment.user_id == MUser.id)
+        .where(MComment.shader_id == MShader.id)
+        .order_by(MComment.created_at.desc(), MComment.id.desc())
+        .limit(settings.COMMENTS_PAGE_SIZE)
+        .correlate(MShader)
+        .subquery()
+    )
+    comments = (
+        select(func.coalesce(
+            func.json_agg(aggregate_order_by(page.c.comment, page.c.position)),
+            literal_column("'[]'::json")
+        ))
+        .scalar_subquery()
+    )
+    comments_next_cursor = (
+        select(cursor_expression("comments_desc", page.c.created_at, page.c.id))
+        .where(page.c.position == settings.COMMENTS_PAGE_SIZE)
+        .scalar_subquery()
+    )
+
+    MForkedShader = aliased(MShader)
+    return (
+        select(
+            MShader.visibility,
+            MShader.user_id,
+            *shader_version(user_id),
+            cast(func.json_build_object(
+                "shader", shader_json(MShader),
+                "is_liked", is_liked,
+                "username", MUser.name,
+                "forked_shader", case((MForkedShader.id != None, shader_json(MForkedShader))),
+                "comments", comments,
+                "comments_next_cursor", comments_next_cursor
+            ), Text).label("payload")
+        )
+        .join(MUser, MShader.user_id == MUser.id)
+        .outerjoin(MForkedShader, MShader.id_forked == MForkedShader.id)
+        .where(MShader.id == shader_id)
+    )
+
+
+def shader_response(request: Request, detail: ShaderDetail) -> Response:
+    if is_not_modified(request, detail.etag):
+        return not_modified(detail.etag)
+
+    response = Response(content=detail.payload, media_type="application/json")
+    set_validators(response, detail.etag)
+    return response
+
+
+@router.post("/", response_model=ShaderOut)
 async def upsert_shader(
         body: ShaderIn,
         user_id: int = Depends(get_current_user_id)
@@ -203,9 +373,23 @@ async def upsert_shader(
                 id_forked=body.id_forked
             )
             session.add(new_shader)
+            if body.id_forked is not None:
+                await session.flush()
+                session.add(MActivity(type="fork",
+                                      created_at=new_shader.created_at,
+                                      user_id=user_id,
+                                      shader_id=new_shader.id))
+                await session.execute(
+                    update(MShader)
+                    .where(MShader.id == body.id_forked)
+                    .values(forks_count=MShader.forks_count + 1)
+                )
+                await session.execute(change_user_stats(body.id_forked, forks=1))
             await session.commit()
             await session.refresh(new_shader)
-            return new_shader
+
+        await invalidate_gallery()
+        return new_shader
 
     else:  # UPDATE
         async with async_session() as session:
@@ -223,22 +407,43 @@ async def upsert_shader(
             shader.updated_at = datetime.datetime.now(datetime.UTC).replace(tzinfo=None)
             await session.commit()
             await session.refresh(shader)
-            return shader
+
+        await cache.delete(shader_key(shader.id))
+        await invalidate_gallery()
+        return shader
 
 
 @router.delete("/{shader_id}")
 async def delete_shader(shader_id: int, user_id: int = Depends(get_current_user_id)):
     async with async_session() as session:
-        shader = await session.execute(
-            select(MShader).where(MShader.id == shader_id)
+        # Строка блокируется до конца транзакции: лайк или комментарий, пришедший между чтением
+        # счётчиков и удалением, дождётся его, и автор не получит лишний или потерянный счёт
+        shader = await session.scalar(
+            select(MShader)
+            .where(MShader.id == shader_id)
+            .with_for_update()
         )
         if shader is None:
             raise HTTPException(status_code=404, detail="Shader not found")
 
-        shader = shader.scalars().first()
         if shader.user_id != user_id:
             raise HTTPException(status_code=403, detail="User is not the owner of the shader")
 
+        # Лайки, комментарии и форки удаляемого шейдера больше не засчитываются автору
+        await session.execute(change_user_stats(shader.id,
+                                                likes=-shader.likes_count,
+                                                comments=-shader.comments_count,
+                                                forks=-shader.forks_count))
         await session.delete(shader)
+        if shader.id_forked is not None:
+            await session.execute(
+                update(MShader)
+                .where(MShader.id == shader.id_forked)
+                .values(forks_count=MShader.forks_count - 1)
+            )
+            await session.execute(change_user_stats(shader.id_forked, forks=-1))
         await session.commit()
-        return
+
+    await cache.delete(shader_key(shader_id), comments_key(shader_id))
+    await invalidate_gallery()
+    return
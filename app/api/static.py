@@ -0,0 +1,42 @@
+import os
+import re
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import StaticFiles, NotModifiedResponse
+
+from app.settings import settings
+
+# Варианты изображений названы по хешу содержимого и никогда не перезаписываются
+IMMUTABLE_PATTERN = re.compile(r"^[0-9a-f]{64}_\d+\.webp$")
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+MUTABLE_CACHE_CONTROL = "public, no-cache"
+
+
+class PublicFiles(StaticFiles):
+    # Раздача public/: неизменяемые файлы кэшируются браузером и прокси на год без повторных проверок,
+    # остальные с обязательной проверкой по ETag. Диапазоны (Range) поддерживает FileResponse
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope, status_code: int = 200) -> Response:
+        request_headers = Headers(scope=scope)
+        name = os.path.basename(full_path)
+
+        response = FileResponse(full_path, status_code=status_code, stat_result=stat_result)
+        if IMMUTABLE_PATTERN.match(name):
+            # Сильный ETag прямо из имени файла
+            response.headers["etag"] = f'"{name.rsplit(".", 1)[0]}"'
+            response.headers["cache-control"] = IMMUTABLE_CACHE_CONTROL
+        else:
+            response.headers["cache-control"] = MUTABLE_CACHE_CONTROL
+
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+
+        if settings.STATIC_ACCEL_REDIRECT_PREFIX:
+            # Файл отдаёт nginx через sendfile, приложение передаёт только заголовки
+            relative = os.path.relpath(full_path, self.directory).replace(os.sep, "/")
+            headers = {key: value for key, value in response.headers.items()
+                       if key in ("etag", "cache-control", "last-modified", "content-type")}
+            headers["x-accel-redirect"] = f"{settings.STATIC_ACCEL_REDIRECT_PREFIX.rstrip('/')}/{relative}"
+            return Response(status_code=status_code, headers=headers)
+        return response
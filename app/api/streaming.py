@@ -0,0 +1,90 @@
+import asyncio
+import logging
+
+import orjson
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+
+from app.db.replicas import read_session
+from app.exceptions import ServerBusyException
+from app.security.dependencies import get_current_user_id
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+NDJSON = "application/x-ndjson"
+# Сколько строк за раз забирается из серверного курсора
+STREAM_BATCH_SIZE = 500
+
+
+class StreamLimiter:
+    # Каждый поток держит соединение из пула чтения до конца ответа, поэтому одновременных потоков
+    # не больше limit, лишние сразу получают 503, а поток дольше timeout секунд обрывается
+
+    def __init__(self, limit: int, timeout: float):
+        self._slots = asyncio.Semaphore(limit)
+        self.limit = limit
+        self.timeout = timeout
+        self.in_flight = 0
+        self.rejected = 0
+        self.completed = 0
+        self.timed_out = 0
+
+    async def acquire(self) -> None:
+        if self._slots.locked():
+            self.rejected += 1
+            raise ServerBusyException
+        await self._slots.acquire()
+        self.in_flight += 1
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._slots.release()
+
+    def metrics(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "limit": self.limit,
+            "rejected": self.rejected,
+            "completed": self.completed,
+            "timed_out": self.timed_out,
+        }
+
+
+streams = StreamLimiter(settings.NDJSON_MAX_STREAMS, settings.NDJSON_STREAM_TIMEOUT_SECONDS)
+
+
+class LimitedStreamingResponse(StreamingResponse):
+    # Место освобождается, когда ответ отправлен, оборван по времени или клиент отключился,
+    # даже если до чтения из базы дело не дошло
+
+    async def __call__(self, scope, receive, send):
+        try:
+            async with asyncio.timeout(streams.timeout):
+                await super().__call__(scope, receive, send)
+            streams.completed += 1
+        except TimeoutError:
+            # Ответ остаётся незавершённым, и сервер закрывает соединение
+            streams.timed_out += 1
+            logger.warning("NDJSON stream %s exceeded %s seconds", scope.get("path"), streams.timeout)
+        finally:
+            streams.release()
+
+
+def wants_ndjson(request: Request) -> bool:
+    return NDJSON in request.headers.get("accept", "")
+
+
+async def ndjson_response(request: Request, query, to_json=dict) -> StreamingResponse:
+    # Строки читаются серверным курсором и отправляются по мере получения, весь список в памяти не собирается.
+    # Соединение с базой занято, пока клиент не дочитает ответ, поэтому выгрузка только для вошедших пользователей
+    await get_current_user_id(request)
+    await streams.acquire()
+
+    async def lines():
+        async with read_session() as session:
+            result = await session.stream(query.execution_options(yield_per=STREAM_BATCH_SIZE))
+            async for rows in result.mappings().partitions():
+                yield b"".join(orjson.dumps(to_json(row), option=orjson.OPT_APPEND_NEWLINE) for row in rows)
+
+    return LimitedStreamingResponse(lines(), media_type=NDJSON)
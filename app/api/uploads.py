@@ -0,0 +1,130 @@
+import hashlib
+import os
+import tempfile
+import uuid
+
+from fastapi import HTTPException, UploadFile
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import PlainTextResponse
+
+from app.exceptions import FileTooLargeException, UnsupportedFileTypeException
+from app.settings import settings
+
+PUBLIC_DIR = "public"
+CHUNK_SIZE = 1024 * 1024
+# Запас на заголовки multipart поверх размера самого файла
+MULTIPART_OVERHEAD = 64 * 1024
+UPLOAD_PATHS = ("/profile/avatar", "/profile/background")
+
+# Тип определяется по первым байтам файла, а не по имени и заголовкам клиента
+SIGNATURES = [
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"GIF87a", ".gif"),
+    (b"GIF89a", ".gif"),
+]
+
+
+def sniff_extension(head: bytes) -> str | None:
+    for signature, extension in SIGNATURES:
+        if head.startswith(signature):
+            return extension
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ".webp"
+    return None
+
+
+def remove_public_file(url: str | None) -> None:
+    # Выполняется фоновой задачей после ответа
+    if url:
+        try:
+            os.remove(os.path.join(PUBLIC_DIR, url))
+        except FileNotFoundError:
+            pass
+
+
+def write_chunk(f, digest, chunk: bytes) -> None:
+    digest.update(chunk)
+    f.write(chunk)
+
+
+async def save_upload(upload: UploadFile, directory: str) -> tuple[str, str]:
+    # Файл пишется кусками во временный файл рядом с целевым, вся работа с диском идёт в пуле потоков,
+    # а в public/ он появляется атомарным переименованием уже целиком. Возвращает URL и хеш содержимого
+    head = await upload.read(CHUNK_SIZE)
+    extension = sniff_extension(head)
+    if extension is None:
+        raise UnsupportedFileTypeException
+
+    target_dir = os.path.join(PUBLIC_DIR, directory)
+    fd, temp_path = await run_in_threadpool(tempfile.mkstemp, dir=target_dir, prefix=".upload-")
+    try:
+        digest = hashlib.sha256()
+        with os.fdopen(fd, "wb") as f:
+            size = 0
+            chunk = head
+            while chunk:
+                size += len(chunk)
+                if size > settings.UPLOAD_MAX_BYTES:
+                    raise FileTooLargeException
+                await run_in_threadpool(write_chunk, f, digest, chunk)
+                chunk = await upload.read(CHUNK_SIZE)
+            await run_in_threadpool(os.fsync, f.fileno())
+
+        url = f"{directory}/{uuid.uuid4().hex}{extension}"
+        await run_in_threadpool(os.replace, temp_path, os.path.join(PUBLIC_DIR, url))
+    except BaseException:
+        await run_in_threadpool(os.remove, temp_path)
+        raise
+    return url, digest.hexdigest()
+
+
+class UploadLimitMiddleware:
+    # Слишком большие загрузки отклоняются по Content-Length до того, как тело будет прочитано и разобрано.
+    # Тело без Content-Length (chunked) считается по мере чтения и обрывается, как только превысит лимит
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in UPLOAD_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        limit = settings.UPLOAD_MAX_BYTES + MULTIPART_OVERHEAD
+        for name, value in scope["headers"]:
+            if name == b"content-length" and value.isdigit() and int(value) > limit:
+                await self.reject(scope, receive, send)
+                return
+
+        received = 0
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # FastAPI пропускает HTTPException из разбора формы как есть, и клиент получает 413
+                    raise FileTooLargeException
+            return message
+
+        async def tracking_send(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except HTTPException as e:
+            # Тело могли читать и за пределами обработчика исключений FastAPI
+            if e is not FileTooLargeException or response_started:
+                raise
+            await self.reject(scope, receive, send)
+
+    @staticmethod
+    async def reject(scope, receive, send):
+        response = PlainTextResponse(FileTooLargeException.detail, status_code=FileTooLargeException.status_code)
+        await response(scope, receive, send)
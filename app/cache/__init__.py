@@ -0,0 +1,9 @@
+from . import backend
+from . import base
+from . import memory
+
+__all__ = [
+    "backend",
+    "base",
+    "memory"
+]
@@ -0,0 +1,95 @@
+import asyncio
+import uuid
+from typing import Awaitable, Callable
+
+LOCK_TTL_SECONDS = 10
+LOCK_POLL_SECONDS = 0.05
+
+
+class CacheBackend:
+    # Общий интерфейс хранилищ кэша, API работает только через него
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    async def peek(self, key: str):
+        # Чтение без учёта в статистике попаданий
+        raise NotImplementedError
+
+    async def peek_many(self, keys: list[str]) -> list:
+        raise NotImplementedError
+
+    async def get(self, key: str):
+        return self._count(await self.peek(key))
+
+    async def get_many(self, keys: list[str]) -> list:
+        return [self._count(value) for value in await self.peek_many(keys)]
+
+    async def set(self, key: str, value, ttl: float | None = None) -> None:
+        raise NotImplementedError
+
+    async def delete(self, *keys: str) -> None:
+        raise NotImplementedError
+
+    async def get_version(self, namespace: str) -> int:
+        raise NotImplementedError
+
+    async def bump_version(self, namespace: str) -> int:
+        raise NotImplementedError
+
+    async def acquire_lock(self, key: str, ttl: float) -> str | None:
+        raise NotImplementedError
+
+    async def release_lock(self, key: str, token: str) -> None:
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+    def _count(self, value):
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+    async def get_or_set(self, key: str, compute: Callable[[], Awaitable], ttl: float | None = None):
+        # Защита от лавины: значение пересчитывает только тот, кто взял блокировку,
+        # остальные ждут, пока оно появится в кэше
+        value = await self.get(key)
+        if value is not None:
+            return value
+
+        lock_key = f"lock:{key}"
+        waited = 0.0
+        while waited < LOCK_TTL_SECONDS:
+            token = await self.acquire_lock(lock_key, LOCK_TTL_SECONDS)
+            if token is not None:
+                try:
+                    value = await compute()
+                    await self.set(key, value, ttl)
+                    return value
+                finally:
+                    await self.release_lock(lock_key, token)
+
+            await asyncio.sleep(LOCK_POLL_SECONDS)
+            waited += LOCK_POLL_SECONDS
+            # Ожидание уже засчитано одним промахом выше
+            value = await self.peek(key)
+            if value is not None:
+                return value
+
+        # Владелец блокировки не успел, считаем сами
+        return await compute()
+
+
+def new_lock_token() -> str:
+    return uuid.uuid4().hex
@@ -0,0 +1,43 @@
+from app.cache.backend import CacheBackend
+from app.cache.memory import MemoryCache
+from app.settings import settings
+
+GALLERY_NAMESPACE = "gallery"
+
+
+def create_cache() -> CacheBackend:
+    match settings.CACHE_BACKEND:
+        case "redis":
+            from app.cache.redis_cache import RedisCache
+            return RedisCache(settings.REDIS_URL, ttl=settings.CACHE_TTL_SECONDS, prefix=settings.CACHE_KEY_PREFIX)
+        case _:  # "memory"
+            return MemoryCache(max_size=settings.CACHE_MAX_SIZE, ttl=settings.CACHE_TTL_SECONDS)
+
+
+cache = create_cache()
+
+
+def gallery_key(version: int, sort: str, page: int, cursor: str | None) -> str:
+    return f"{GALLERY_NAMESPACE}:v{version}:{sort}:{cursor or page}"
+
+
+def gallery_total_key(version: int) -> str:
+    return f"{GALLERY_NAMESPACE}:v{version}:total"
+
+
+def shader_key(shader_id: int) -> str:
+    return f"shader:{shader_id}"
+
+
+def comments_key(shader_id: int) -> str:
+    # Первая страница комментариев
+    return f"comments:first:{shader_id}"
+
+
+def user_key(user_id: int) -> str:
+    return f"user:{user_id}"
+
+
+async def invalidate_gallery() -> None:
+    # Старые страницы галереи становятся недостижимы и доживают до истечения TTL
+    await cache.bump_version(GALLERY_NAMESPACE)
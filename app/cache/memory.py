@@ -0,0 +1,66 @@
+import time
+from collections import OrderedDict
+
+from app.cache.backend import CacheBackend, new_lock_token
+
+
+class MemoryCache(CacheBackend):
+    # LRU-кэш в памяти процесса с ограничением по числу записей и временем жизни записи
+
+    def __init__(self, max_size: int, ttl: float):
+        super().__init__(ttl)
+        self.max_size = max_size
+        self._data: OrderedDict[str, tuple[float, object]] = OrderedDict()
+        self._versions: dict[str, int] = {}
+        self._locks: dict[str, tuple[float, str]] = {}
+
+    async def peek(self, key: str):
+        item = self._data.get(key)
+        if item is None or item[0] < time.monotonic():
+            if item is not None:
+                del self._data[key]
+            return None
+
+        self._data.move_to_end(key)
+        return item[1]
+
+    async def peek_many(self, keys: list[str]) -> list:
+        return [await self.peek(key) for key in keys]
+
+    async def set(self, key: str, value, ttl: float | None = None) -> None:
+        self._data[key] = (time.monotonic() + (ttl or self.ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    async def delete(self, *keys: str) -> None:
+        for key in keys:
+            self._data.pop(key, None)
+
+    async def get_version(self, namespace: str) -> int:
+        return self._versions.get(namespace, 0)
+
+    async def bump_version(self, namespace: str) -> int:
+        self._versions[namespace] = self._versions.get(namespace, 0) + 1
+        return self._versions[namespace]
+
+    async def acquire_lock(self, key: str, ttl: float) -> str | None:
+        lock = self._locks.get(key)
+        if lock is not None and lock[0] > time.monotonic():
+            return None
+
+        token = new_lock_token()
+        self._locks[key] = (time.monotonic() + ttl, token)
+        return token
+
+    async def release_lock(self, key: str, token: str) -> None:
+        lock = self._locks.get(key)
+        if lock is not None and lock[1] == token:
+            del self._locks[key]
+
+    def stats(self) -> dict:
+        return {
+            **super().stats(),
+            "size": len(self._data),
+            "max_size": self.max_size
+        }
@@ -0,0 +1,77 @@
+import orjson
+
+from app.cache.backend import CacheBackend, new_lock_token
+
+# Снимаем блокировку, только если она всё ещё наша
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class RedisCache(CacheBackend):
+    # Общий для всех воркеров кэш на Redis-совместимом сервере. Значения хранятся в JSON, а не в pickle:
+    # иначе любой, кто может писать в Redis, выполнил бы свой код в каждом воркере.
+    # Кортежи, в том числе именованные, возвращаются списками
+
+    def __init__(self, url: str, ttl: float, prefix: str = "", client=None):
+        from redis import asyncio as aioredis
+
+        super().__init__(ttl)
+        self.prefix = prefix
+        # client позволяет подставить готовое подключение, например тестовый сервер
+        self._redis = client if client is not None else aioredis.from_url(url)
+        self._release_lock = self._redis.register_script(RELEASE_LOCK_SCRIPT)
+
+    async def peek(self, key: str):
+        return self._load(await self._redis.get(self.prefix + key))
+
+    async def peek_many(self, keys: list[str]) -> list:
+        if not keys:
+            return []
+        raws = await self._redis.mget([self.prefix + key for key in keys])
+        return [self._load(raw) for raw in raws]
+
+    async def set(self, key: str, value, ttl: float | None = None) -> None:
+        await self._redis.set(self.prefix + key, orjson.dumps(value, default=tuple_as_list), px=int((ttl or self.ttl) * 1000))
+
+    async def delete(self, *keys: str) -> None:
+        if keys:
+            await self._redis.delete(*[self.prefix + key for key in keys])
+
+    async def get_version(self, namespace: str) -> int:
+        return int(await self._redis.get(f"{self.prefix}version:{namespace}") or 0)
+
+    async def bump_version(self, namespace: str) -> int:
+        return await self._redis.incr(f"{self.prefix}version:{namespace}")
+
+    async def acquire_lock(self, key: str, ttl: float) -> str | None:
+        token = new_lock_token()
+        if await self._redis.set(self.prefix + key, token, nx=True, px=int(ttl * 1000)):
+            return token
+        return None
+
+    async def release_lock(self, key: str, token: str) -> None:
+        await self._release_lock(keys=[self.prefix + key], args=[token])
+
+    async def close(self) -> None:
+        await self._redis.aclose()
+
+    @staticmethod
+    def _load(raw):
+        if raw is None:
+            return None
+        try:
+            return orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            # Значения в старом формате считаются промахом и перезаписываются
+            return None
+
+
+def tuple_as_list(value):
+    # orjson сериализует только сам tuple, а не его подклассы
+    if isinstance(value, tuple):
+        return list(value)
+    raise TypeError
@@ -1,5 +1,17 @@
 from . import base
+from . import blobs
+from . import likes
+from . import pagination
+from . import pool
+from . import replicas
+from . import user_stats
 
 __all__ = [
-    "base"
-]
\ No newline at end of file
+    "base",
+    "blobs",
+    "likes",
+    "pagination",
+    "pool",
+    "replicas",
+    "user_stats"
+]
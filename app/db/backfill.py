@@ -0,0 +1,53 @@
+import asyncio
+
+from sqlalchemy import select, insert, func, literal, exists
+
+from app.db.base import async_session
+from app.models.activity import Activity as MActivity
+from app.models.comment import Comment as MComment
+from app.models.like import Like as MLike
+from app.models.shader import Shader as MShader
+
+BATCH_SIZE = 5000
+
+
+def activity_sources() -> list:
+    # Источники ленты: (таблица-источник, выборка user_id, shader_id, type, created_at)
+    return [
+        (MLike, select(MLike.user_id, MLike.shader_id, literal("like"), MLike.created_at)),
+        (MComment, select(MComment.user_id, MComment.shader_id, literal("comment"), MComment.created_at)),
+        (MShader, select(MShader.user_id, MShader.id, literal("fork"), MShader.created_at)
+         .where(MShader.id_forked != None)),
+    ]
+
+
+async def backfill_activities(batch_size: int = BATCH_SIZE) -> int:
+    # Перенос существующих действий в activities пачками по диапазону id источника.
+    # Уже перенесённые строки пропускаются, поэтому команду можно запускать повторно
+    inserted = 0
+    for model, query in activity_sources():
+        async with async_session() as session:
+            max_id = await session.scalar(select(func.max(model.id))) or 0
+
+        for lower_id in range(0, max_id, batch_size):
+            user_id, shader_id, activity_type, created_at = query.selected_columns
+            batch = (
+                query
+                .where((model.id > lower_id) & (model.id <= lower_id + batch_size))
+                .where(~exists().where((MActivity.user_id == user_id)
+                                       & (MActivity.shader_id == shader_id)
+                                       & (MActivity.type == activity_type)
+                                       & (MActivity.created_at == created_at)))
+            )
+            async with async_session() as session:
+                result = await session.execute(
+                    insert(MActivity).from_select(["user_id", "shader_id", "type", "created_at"], batch)
+                )
+                await session.commit()
+            inserted += result.rowcount
+
+    return inserted
+
+
+if __name__ == '__main__':
+    print(f"Добавлено записей в ленту: {asyncio.run(backfill_activities())}")
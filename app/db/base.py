@@ -1,12 +1,46 @@
+import uuid
 
+from sqlalchemy import make_url
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import declarative_base, sessionmaker
 
-
+from app.db.pool import InstrumentedPool
 from app.settings import settings
 
 DATABASE_URL = f"postgresql+asyncpg://{settings.POSTGRES_USER}:{settings.POSTGRES_PASSWORD}@{settings.POSTGRES_ADDRESS}:{settings.POSTGRES_PORT}/{settings.POSTGRES_DB}"
+if settings.DATABASE_URL:
+    DATABASE_URL = settings.DATABASE_URL
+
+# Каждый воркер получает свою долю соединений, чтобы в сумме не превысить лимит Postgres
+WORKERS = settings.SERVER_WORKERS if settings.SERVER_PRODUCTION else 1
+POOL_SIZE = settings.DB_POOL_SIZE or max(
+    1, (settings.POSTGRES_MAX_CONNECTIONS - settings.POSTGRES_RESERVED_CONNECTIONS) // WORKERS - settings.DB_MAX_OVERFLOW
+)
+
+connect_args = {"statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE}
+if settings.DB_PGBOUNCER:
+    # PgBouncer в режиме транзакций не сохраняет подготовленные выражения между запросами
+    connect_args = {
+        "statement_cache_size": 0,
+        "prepared_statement_cache_size": 0,
+        "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4()}__",
+    }
+
+
+def make_engine(url: str):
+    # URL может быть общим с alembic, поэтому драйвер заменяется на асинхронный
+    return create_async_engine(
+        make_url(url).set(drivername="postgresql+asyncpg"),
+        poolclass=InstrumentedPool,
+        pool_size=POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT_SECONDS,
+        pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+        connect_args=connect_args,
+    )
+
 
-engine = create_async_engine(DATABASE_URL)
+engine = make_engine(DATABASE_URL)
 async_session = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
 Base = declarative_base()
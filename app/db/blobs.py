@@ -0,0 +1,77 @@
+import datetime
+import re
+
+from sqlalchemy import select, update, delete, tuple_, case
+from sqlalchemy.dialects.postgresql import insert
+
+from app.db.base import async_session
+from app.models.blob import Blob as MBlob
+
+BATCH_SIZE = 100
+# avatars/<sha256>_<размер>.webp, ссылки старого вида хранилищем не учитываются
+BLOB_URL_PATTERN = re.compile(r"^(avatars|backgrounds)/([0-9a-f]{64})_\d+\.webp$")
+
+
+def now() -> datetime.datetime:
+    return datetime.datetime.now(datetime.UTC).replace(tzinfo=None)
+
+
+def blob_key(url: str | None) -> tuple[str, str] | None:
+    # (sha256, kind) по URL варианта изображения
+    match = BLOB_URL_PATTERN.match(url or "")
+    if match is None:
+        return None
+    return match.group(2), match.group(1)
+
+
+async def acquire_blob(session, sha256: str, kind: str) -> None:
+    # Ссылка берётся до проверки файлов: пока счётчик больше нуля, сборщик их не тронет
+    statement = insert(MBlob).values(sha256=sha256, kind=kind, ref_count=1, created_at=now())
+    await session.execute(
+        statement.on_conflict_do_update(
+            index_elements=[MBlob.sha256, MBlob.kind],
+            set_={"ref_count": MBlob.ref_count + 1, "released_at": None}
+        )
+    )
+
+
+async def release_blob(session, url: str | None) -> bool:
+    # Возвращает False для ссылок не из хранилища, их файлы удаляются как раньше
+    key = blob_key(url)
+    if key is None:
+        return False
+    await session.execute(
+        update(MBlob)
+        .where((MBlob.sha256 == key[0]) & (MBlob.kind == key[1]) & (MBlob.ref_count > 0))
+        .values(ref_count=MBlob.ref_count - 1,
+                released_at=case((MBlob.ref_count == 1, now()), else_=None))
+    )
+    return True
+
+
+async def collect_blobs(remove_files, grace_seconds: float, batch_size: int = BATCH_SIZE) -> int:
+    # Удаление файлов, на которые давно никто не ссылается. Строки удаляются и файлы стираются в одной транзакции:
+    # загрузка той же картинки ждёт на блокировке строки и после коммита создаст файлы заново
+    cutoff = now() - datetime.timedelta(seconds=grace_seconds)
+    collected = 0
+    while True:
+        async with async_session() as session:
+            unused = (
+                select(MBlob.sha256, MBlob.kind)
+                .where((MBlob.ref_count == 0) & (MBlob.released_at < cutoff))
+                .limit(batch_size)
+                .with_for_update(skip_locked=True)
+            )
+            rows = (await session.execute(
+                delete(MBlob)
+                .where(tuple_(MBlob.sha256, MBlob.kind).in_(unused))
+                .returning(MBlob.sha256, MBlob.kind)
+            )).all()
+            for sha256, kind in rows:
+                await remove_files(sha256, kind)
+            await session.commit()
+
+        collected += len(rows)
+        if len(rows) < batch_size:
+            return collected
+
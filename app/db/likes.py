@@ -0,0 +1,152 @@
+import asyncio
+import datetime
+import logging
+from collections import Counter
+
+from sqlalchemy import select, update, delete, values, column, tuple_, Integer, TIMESTAMP
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.cache.base import cache, shader_key, invalidate_gallery
+from app.db.base import async_session
+from app.db.user_stats import change_user_likes
+from app.models.activity import Activity as MActivity
+from app.models.like import Like as MLike
+from app.models.shader import Shader as MShader
+from app.models.user import User as MUser
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+async def write_likes(session,
+                      liked: list[tuple[int, int, datetime.datetime]],
+                      unliked: list[tuple[int, int]]) -> dict[int, int]:
+    # Пачка лайков (user_id, shader_id, created_at) и снятых лайков (user_id, shader_id) за несколько запросов.
+    # Повторный лайк и снятие несуществующего ничего не меняют, поэтому пачку можно безопасно применить ещё раз.
+    # Возвращает изменение числа лайков по шейдерам
+    deltas = Counter()
+
+    if liked:
+        rows = values(column("user_id", Integer), column("shader_id", Integer), column("created_at", TIMESTAMP),
+                      name="liked").data(liked)
+        inserted = (await session.execute(
+            insert(MLike)
+            .from_select(
+                ["user_id", "shader_id", "created_at"],
+                # Шейдер или пользователь могли быть удалены, пока лайк ждал в буфере
+                select(rows.c.user_id, rows.c.shader_id, rows.c.created_at)
+                .join(MShader, MShader.id == rows.c.shader_id)
+                .join(MUser, MUser.id == rows.c.user_id)
+            )
+            .on_conflict_do_nothing(constraint="uq_likes_user_id_shader_id")
+            .returning(MLike.user_id, MLike.shader_id, MLike.created_at)
+        )).all()
+        if inserted:
+            await session.execute(insert(MActivity), [
+                {"type": "like", "created_at": created_at, "user_id": user_id, "shader_id": shader_id}
+                for user_id, shader_id, created_at in inserted
+            ])
+            deltas.update(shader_id for _, shader_id, _ in inserted)
+
+    if unliked:
+        deleted = (await session.execute(
+            delete(MLike)
+            .where(tuple_(MLike.user_id, MLike.shader_id).in_(unliked))
+            .returning(MLike.user_id, MLike.shader_id)
+        )).all()
+        if deleted:
+            # Снятый лайк пропадает и из ленты
+            await session.execute(
+                delete(MActivity)
+                .where(MActivity.type == "like")
+                .where(tuple_(MActivity.user_id, MActivity.shader_id).in_([tuple(row) for row in deleted]))
+            )
+            deltas.subtract(shader_id for _, shader_id in deleted)
+
+    deltas = {shader_id: delta for shader_id, delta in deltas.items() if delta}
+    if deltas:
+        changes = values(column("shader_id", Integer), column("delta", Integer),
+                         name="changes").data(list(deltas.items()))
+        await session.execute(
+            update(MShader)
+            .where(MShader.id == changes.c.shader_id)
+            .values(likes_count=MShader.likes_count + changes.c.delta)
+            .execution_options(synchronize_session=False)
+        )
+        await session.execute(change_user_likes(changes))
+    return deltas
+
+
+async def invalidate_likes(deltas: dict[int, int]) -> None:
+    if deltas:
+        await cache.delete(*(shader_key(shader_id) for shader_id in deltas))
+        await invalidate_gallery()
+
+
+class LikeBuffer:
+    # Отложенная запись лайков: последние действия пользователя с шейдером схлопываются в памяти
+    # и записываются пачкой раз в интервал, так что шквал лайков стоит нескольких запросов, а не тысяч транзакций
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        # (user_id, shader_id) -> время лайка или None для снятого лайка
+        self.pending: dict[tuple[int, int], datetime.datetime | None] = {}
+        self._full = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self.flushes = 0
+        self.written = 0
+        self.errors = 0
+
+    def add(self, user_id: int, shader_id: int, created_at: datetime.datetime | None) -> None:
+        self.pending[(user_id, shader_id)] = created_at
+        if len(self.pending) >= self.max_size:
+            self._full.set()
+
+    async def flush(self) -> None:
+        async with self._lock:
+            if not self.pending:
+                return
+            batch, self.pending = self.pending, {}
+            try:
+                async with async_session() as session:
+                    deltas = await write_likes(
+                        session,
+                        [(user_id, shader_id, created_at)
+                         for (user_id, shader_id), created_at in batch.items() if created_at is not None],
+                        [key for key, created_at in batch.items() if created_at is None]
+                    )
+                    await session.commit()
+            except BaseException as e:
+                # Возвращаем пачку, не затирая более свежие действия; повторная запись безопасна
+                self.pending = batch | self.pending
+                if not isinstance(e, (SQLAlchemyError, OSError)):
+                    raise
+                self.errors += 1
+                logger.exception("Failed to flush %d buffered likes", len(batch))
+                return
+
+            self.flushes += 1
+            self.written += len(batch)
+        await invalidate_likes(deltas)
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), settings.LIKE_BUFFER_FLUSH_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            await self.flush()
+
+    def metrics(self) -> dict:
+        return {
+            "enabled": settings.LIKE_BUFFER_ENABLED,
+            "pending": len(self.pending),
+            "flushes": self.flushes,
+            "written": self.written,
+            "errors": self.errors,
+        }
+
+
+like_buffer = LikeBuffer(settings.LIKE_BUFFER_MAX_SIZE)
@@ -0,0 +1,38 @@
+import base64
+import json
+
+from sqlalchemy import tuple_, func, cast, Text
+
+from app.exceptions import InvalidCursorException
+
+
+def encode_cursor(sort: str, value, row_id: int) -> str:
+    # Курсор непрозрачен для клиента: режим сортировки, значение ключа и id последней строки
+    if hasattr(value, "isoformat"):
+        value = value.isoformat()
+    raw = json.dumps({"sort": sort, "value": value, "id": row_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def cursor_expression(sort: str, value, row_id):
+    # Тот же курсор, что и encode_cursor, но собранный в Postgres, когда весь ответ строится в базе
+    raw = cast(func.json_build_object("sort", sort, "value", value, "id", row_id), Text)
+    return func.translate(func.encode(func.convert_to(raw, "UTF8"), "base64"), "+/\n=", "-_")
+
+
+def decode_cursor(cursor: str, sort: str, value_type=int) -> tuple:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+        if data["sort"] != sort:
+            raise InvalidCursorException
+        return value_type(data["value"]), int(data["id"])
+    except (ValueError, TypeError, KeyError):
+        raise InvalidCursorException
+
+
+def keyset_condition(columns: list, values: tuple, descending: bool = True):
+    # Условие «строго после курсора» по составному ключу (значение сортировки, id)
+    if descending:
+        return tuple_(*columns) < tuple_(*values)
+    return tuple_(*columns) > tuple_(*values)
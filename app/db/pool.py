@@ -0,0 +1,58 @@
+import time
+
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+
+class PoolStats:
+    # Счётчики ожидания соединений из пула
+
+    def __init__(self):
+        self.waiting = 0
+        self.checkouts = 0
+        self.checkout_seconds_total = 0.0
+        self.checkout_seconds_max = 0.0
+        self.timeouts = 0
+
+    def observe(self, seconds: float) -> None:
+        self.checkouts += 1
+        self.checkout_seconds_total += seconds
+        self.checkout_seconds_max = max(self.checkout_seconds_max, seconds)
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    # Пул, замеряющий очередь и время получения соединения
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def _do_get(self):
+        self.stats.waiting += 1
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            self.stats.timeouts += 1
+            raise
+        finally:
+            self.stats.waiting -= 1
+            self.stats.observe(time.perf_counter() - start)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+    def metrics(self) -> dict:
+        checkouts = self.stats.checkouts
+        return {
+            "size": self.size(),
+            "checked_out": self.checkedout(),
+            "overflow": self.overflow(),
+            "waiting": self.stats.waiting,
+            "checkouts": checkouts,
+            "timeouts": self.stats.timeouts,
+            "checkout_seconds_avg": self.stats.checkout_seconds_total / checkouts if checkouts else 0.0,
+            "checkout_seconds_max": self.stats.checkout_seconds_max,
+        }
@@ -0,0 +1,120 @@
+import argparse
+import asyncio
+
+from sqlalchemy import select, update, func
+from sqlalchemy.dialects.postgresql import insert
+
+from app.db.base import async_session
+from app.models.comment import Comment as MComment
+from app.models.like import Like as MLike
+from app.models.shader import Shader as MShader
+from app.models.user import User as MUser
+from app.models.user_stats import UserStats as MUserStats
+
+BATCH_SIZE = 1000
+
+
+async def reconcile_shader_counters(batch_size: int = BATCH_SIZE) -> int:
+    # Пересчёт счётчиков лайков, комментариев и форков пачками по диапазону id,
+    # каждая пачка в отдельной транзакции, чтобы не держать блокировки на всю таблицу
+    fixed = 0
+    last_id = 0
+    while True:
+        async with async_session() as session:
+            upper_id = await session.scalar(
+                select(func.max(MShader.id))
+                .where(MShader.id.in_(
+                    select(MShader.id)
+                    .where(MShader.id > last_id)
+                    .order_by(MShader.id)
+                    .limit(batch_size)
+                ))
+            )
+            if upper_id is None:
+                return fixed
+
+            likes = select(func.count(MLike.id)).where(MLike.shader_id == MShader.id).scalar_subquery()
+            comments = select(func.count(MComment.id)).where(MComment.shader_id == MShader.id).scalar_subquery()
+            Fork = MShader.__table__.alias("fork")
+            forks = select(func.count(Fork.c.id)).where(Fork.c.id_forked == MShader.id).scalar_subquery()
+
+            result = await session.execute(
+                update(MShader)
+                .where((MShader.id > last_id) & (MShader.id <= upper_id))
+                .where((MShader.likes_count != likes)
+                       | (MShader.comments_count != comments)
+                       | (MShader.forks_count != forks))
+                .values(likes_count=likes, comments_count=comments, forks_count=forks)
+                .execution_options(synchronize_session=False)
+            )
+            await session.commit()
+
+        fixed += result.rowcount
+        last_id = upper_id
+
+
+async def reconcile_user_stats(batch_size: int = BATCH_SIZE) -> int:
+    # Пересчёт user_stats из счётчиков шейдеров пачками по диапазону id пользователей,
+    # поэтому запускать его стоит после reconcile_shader_counters
+    fixed = 0
+    last_id = 0
+    while True:
+        async with async_session() as session:
+            upper_id = await session.scalar(
+                select(func.max(MUser.id))
+                .where(MUser.id.in_(
+                    select(MUser.id)
+                    .where(MUser.id > last_id)
+                    .order_by(MUser.id)
+                    .limit(batch_size)
+                ))
+            )
+            if upper_id is None:
+                return fixed
+
+            totals = (
+                select(MUser.id,
+                       func.coalesce(func.sum(MShader.likes_count), 0),
+                       func.coalesce(func.sum(MShader.comments_count), 0),
+                       func.coalesce(func.sum(MShader.forks_count), 0))
+                .outerjoin(MShader, MShader.user_id == MUser.id)
+                .where((MUser.id > last_id) & (MUser.id <= upper_id))
+                .group_by(MUser.id)
+            )
+            statement = insert(MUserStats).from_select(
+                ["user_id", "likes_received", "comments_received", "forks_received"], totals
+            )
+            result = await session.execute(
+                statement.on_conflict_do_update(
+                    index_elements=[MUserStats.user_id],
+                    set_={
+                        "likes_received": statement.excluded.likes_received,
+                        "comments_received": statement.excluded.comments_received,
+                        "forks_received": statement.excluded.forks_received,
+                    },
+                    where=(MUserStats.likes_received != statement.excluded.likes_received)
+                          | (MUserStats.comments_received != statement.excluded.comments_received)
+                          | (MUserStats.forks_received != statement.excluded.forks_received)
+                )
+            )
+            await session.commit()
+
+        fixed += result.rowcount
+        last_id = upper_id
+
+
+async def reconcile(every: float | None = None):
+    while True:
+        shaders = await reconcile_shader_counters()
+        users = await reconcile_user_stats()
+        print(f"Исправлено шейдеров: {shaders}, пользователей: {users}")
+        if not every:
+            return
+        await asyncio.sleep(every)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Сверка денормализованных счётчиков с исходными таблицами")
+    parser.add_argument("--every", type=float, default=None,
+                        help="повторять сверку каждые N секунд, вместо cron")
+    asyncio.run(reconcile(parser.parse_args().every))
@@ -0,0 +1,101 @@
+import asyncio
+import contextvars
+import itertools
+import logging
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+from starlette.datastructures import MutableHeaders
+from starlette.requests import HTTPConnection
+
+from app.db.base import async_session, make_engine
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+STICKY_COOKIE = "read_primary"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+# Запрос пришёл в течение короткого окна после записи этого клиента
+prefer_primary = contextvars.ContextVar("prefer_primary", default=False)
+
+
+class ReplicaRouter:
+    # Чтения распределяются по живым репликам по кругу, запись всегда идёт в основную базу
+
+    def __init__(self, urls: list[str]):
+        self.engines = [make_engine(url) for url in urls]
+        self.healthy = list(self.engines)
+        self._sessions = {
+            engine: sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+            for engine in self.engines
+        }
+        self._counter = itertools.count()
+
+    def session(self) -> AsyncSession:
+        healthy = self.healthy
+        if prefer_primary.get() or not healthy:
+            return async_session()
+        return self._sessions[healthy[next(self._counter) % len(healthy)]]()
+
+    async def check(self) -> None:
+        healthy = []
+        for engine in self.engines:
+            try:
+                async with engine.connect() as connection:
+                    await asyncio.wait_for(connection.execute(text("SELECT 1")),
+                                           settings.DB_REPLICA_CHECK_TIMEOUT_SECONDS)
+                healthy.append(engine)
+            except (SQLAlchemyError, OSError, asyncio.TimeoutError):
+                logger.warning("Replica %s is unavailable", engine.url.render_as_string())
+        self.healthy = healthy
+
+    async def run_health_checks(self) -> None:
+        while True:
+            await self.check()
+            await asyncio.sleep(settings.DB_REPLICA_CHECK_INTERVAL_SECONDS)
+
+    async def dispose(self) -> None:
+        for engine in self.engines:
+            await engine.dispose()
+
+    def metrics(self) -> list[dict]:
+        return [
+            {"url": engine.url.render_as_string(), "healthy": engine in self.healthy, **engine.pool.metrics()}
+            for engine in self.engines
+        ]
+
+
+replicas = ReplicaRouter([url.strip() for url in settings.DB_REPLICA_URLS.split(",") if url.strip()])
+read_session = replicas.session
+
+
+class ReadYourWritesMiddleware:
+    # После успешной записи клиент на время получает cookie, и его чтения идут в основную базу,
+    # пока реплики не догонят. Cookie видят все воркеры, в отличие от памяти процесса
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        is_write = scope["method"] not in SAFE_METHODS
+
+        async def send_with_cookie(message):
+            if is_write and message["type"] == "http.response.start" and message["status"] < 400:
+                MutableHeaders(scope=message).append(
+                    "set-cookie",
+                    f"{STICKY_COOKIE}=1; Max-Age={settings.DB_STICKY_SECONDS}; Path=/; HttpOnly; SameSite=Lax"
+                )
+            await send(message)
+
+        token = prefer_primary.set(STICKY_COOKIE in HTTPConnection(scope).cookies)
+        try:
+            await self.app(scope, receive, send_with_cookie)
+        finally:
+            prefer_primary.reset(token)
@@ -0,0 +1,94 @@
+import argparse
+import asyncio
+
+from sqlalchemy import select, func, text
+
+from app.db.backfill import backfill_activities
+from app.db.base import async_session, engine
+from app.db.reconcile import reconcile_shader_counters, reconcile_user_stats
+from app.models.shader import Shader as MShader
+from app.models.user import User as MUser
+
+# Авторы и популярность шейдеров распределены неравномерно: power(random(), 3) чаще даёт малые номера,
+# поэтому у части пользователей и шейдеров данных намного больше, чем у остальных, как в живой базе
+SEED_USERS = text("""
+    INSERT INTO users (name, email, hashed_password, role, created_at, biography)
+    SELECT 'seed' || i, 'seed' || :run || '-' || i || '@example.com', '', 'USER',
+           now() - random() * interval '730 days', 'Biography ' || i
+    FROM generate_series(1, :count) AS i
+""")
+
+SEED_SHADERS = text("""
+    INSERT INTO shaders (title, description, code, created_at, updated_at, visibility, user_id)
+    SELECT 'Shader ' || i, 'Description ' || i, repeat('void main() { gl_FragColor = vec4(1.0); }\n', 20),
+           created_at, created_at + random() * interval '10 days', random() < 0.9,
+           :first_user + floor(:users * power(random(), 3))::int
+    FROM (SELECT i, now() - random() * interval '365 days' AS created_at
+          FROM generate_series(1, :count) AS i) AS s
+""")
+
+SEED_FORKS = text("""
+    UPDATE shaders
+    SET id_forked = :first_shader + floor(random() * (id - :first_shader))::int
+    WHERE id > :first_shader AND id < :first_shader + :count AND random() < 0.1
+""")
+
+SEED_LIKES = text("""
+    INSERT INTO likes (created_at, user_id, shader_id)
+    SELECT now() - random() * interval '365 days',
+           :first_user + floor(random() * :users)::int,
+           :first_shader + floor(:shaders * power(random(), 3))::int
+    FROM generate_series(1, :count) AS i
+    ON CONFLICT DO NOTHING
+""")
+
+SEED_COMMENTS = text("""
+    INSERT INTO comments (text, hidden, created_at, user_id, shader_id)
+    SELECT 'Comment ' || i, random() < 0.05, now() - random() * interval '365 days',
+           :first_user + floor(random() * :users)::int,
+           :first_shader + floor(:shaders * power(random(), 3))::int
+    FROM generate_series(1, :count) AS i
+""")
+
+
+async def seed(users: int, shaders: int, likes: int, comments: int) -> None:
+    # Синтетические данные для проверки планов запросов и замеров, добавляются к уже существующим
+    async with async_session() as session:
+        run = await session.scalar(select(func.coalesce(func.max(MUser.id), 0)))
+        await session.execute(SEED_USERS, {"count": users, "run": str(run)})
+        first_user = await session.scalar(select(func.max(MUser.id))) - users + 1
+
+        await session.execute(SEED_SHADERS, {"count": shaders, "first_user": first_user, "users": users})
+        first_shader = await session.scalar(select(func.max(MShader.id))) - shaders + 1
+        await session.execute(SEED_FORKS, {"count": shaders, "first_shader": first_shader})
+
+        params = {"first_user": first_user, "users": users, "first_shader": first_shader, "shaders": shaders}
+        await session.execute(SEED_LIKES, {"count": likes, **params})
+        await session.execute(SEED_COMMENTS, {"count": comments, **params})
+        await session.commit()
+
+    # Счётчики, user_stats и лента заполняются теми же командами, что и на живой базе
+    await reconcile_shader_counters()
+    await reconcile_user_stats()
+    await backfill_activities()
+
+    async with engine.connect() as connection:
+        connection = await connection.execution_options(isolation_level="AUTOCOMMIT")
+        await connection.execute(text("VACUUM ANALYZE"))
+
+
+async def main(users: int, shaders: int, likes: int, comments: int) -> None:
+    try:
+        await seed(users, shaders, likes, comments)
+    finally:
+        await engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Заполнение базы синтетическими данными для замеров")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--shaders", type=int, default=20000)
+    parser.add_argument("--likes", type=int, default=200000)
+    parser.add_argument("--comments", type=int, default=100000)
+    args = parser.parse_args()
+    asyncio.run(main(args.users, args.shaders, args.likes, args.comments))
@@ -0,0 +1,36 @@
+from sqlalchemy import select, literal, func
+from sqlalchemy.dialects.postgresql import insert
+
+from app.models.shader import Shader as MShader
+from app.models.user_stats import UserStats as MUserStats
+
+
+def change_user_stats(shader_id: int, likes: int = 0, comments: int = 0, forks: int = 0):
+    # Изменение статистики автора шейдера; строка создаётся, если её ещё нет
+    statement = insert(MUserStats).from_select(
+        ["user_id", "likes_received", "comments_received", "forks_received"],
+        select(MShader.user_id, literal(likes), literal(comments), literal(forks))
+        .where(MShader.id == shader_id)
+    )
+    return statement.on_conflict_do_update(
+        index_elements=[MUserStats.user_id],
+        set_={
+            "likes_received": MUserStats.likes_received + statement.excluded.likes_received,
+            "comments_received": MUserStats.comments_received + statement.excluded.comments_received,
+            "forks_received": MUserStats.forks_received + statement.excluded.forks_received,
+        }
+    )
+
+
+def change_user_likes(changes):
+    # Изменение числа лайков у авторов по набору строк (shader_id, delta)
+    statement = insert(MUserStats).from_select(
+        ["user_id", "likes_received"],
+        select(MShader.user_id, func.sum(changes.c.delta))
+        .join(changes, changes.c.shader_id == MShader.id)
+        .group_by(MShader.user_id)
+    )
+    return statement.on_conflict_do_update(
+        index_elements=[MUserStats.user_id],
+        set_={"likes_received": MUserStats.likes_received + statement.excluded.likes_received}
+    )
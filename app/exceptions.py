@@ -18,6 +18,18 @@ UserIdNotFoundException = HTTPException(status_code=status.HTTP_404_NOT_FOUND, d
 
 UserNotFoundException = HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
 
+PasswordChangedException = HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Password was changed concurrently")
+
 RefreshTokenNotFound = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Refresh token is missing")
 
 InvalidRefreshTokenException = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate refresh token")
+
+InvalidCursorException = HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+ServerBusyException = HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Server is busy, try again later",
+                                    headers={"Retry-After": "1"})
+
+FileTooLargeException = HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="File is too large")
+
+UnsupportedFileTypeException = HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                                             detail="Unsupported file type")
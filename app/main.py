@@ -1,21 +1,60 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 import uvicorn
 from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import ORJSONResponse
 from starlette.middleware.cors import CORSMiddleware
 
 from app.api.auth import router as auth_router
 from app.api.likes import router as likes_router
+from app.api.metrics import router as metrics_router
+from app.api.uploads import UploadLimitMiddleware
 from app.api.profile import router as profile_router
 from app.api.shaders import router as shaders_router
+from app.api.static import PublicFiles
 from app.api.comments import router as comments_router
-app = FastAPI()
+from app.api.images import images, run_blob_gc
+from app.cache.base import cache
+from app.db.base import engine
+from app.db.likes import like_buffer
+from app.db.replicas import replicas, ReadYourWritesMiddleware
+from app.security.hashing import hashing
+from app.settings import settings
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    health_checks = asyncio.create_task(replicas.run_health_checks())
+    like_flusher = asyncio.create_task(like_buffer.run())
+    blob_gc = asyncio.create_task(run_blob_gc())
+    yield
+    # uvicorn вызывает это после того, как дождался текущих запросов
+    health_checks.cancel()
+    like_flusher.cancel()
+    blob_gc.cancel()
+    # Остаток буфера лайков записывается до закрытия соединений
+    await like_buffer.flush()
+    await cache.close()
+    await replicas.dispose()
+    await engine.dispose()
+    hashing.shutdown()
+    images.shutdown()
+
+
+# Ответы из словарей и моделей сериализуются через orjson
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
-app.mount("/public", StaticFiles(directory="public"), name="public")
+app.mount("/public", PublicFiles(directory="public"), name="public")
 app.include_router(shaders_router)
 app.include_router(auth_router)
 app.include_router(profile_router)
 app.include_router(likes_router)
 app.include_router(comments_router)
+app.include_router(metrics_router)
+
+app.add_middleware(ReadYourWritesMiddleware)
+app.add_middleware(UploadLimitMiddleware)
 
 # Настройка CORS
 app.add_middleware(
@@ -24,8 +63,28 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Разрешенные методы (GET, POST, etc.)
     allow_headers=["*"],  # Разрешенные заголовки
-    expose_headers=["X-Total-Count"]
+    expose_headers=["X-Total-Count", "X-Next-Cursor"]
 )
 
+
+def run():
+    options = {
+        "host": settings.SERVER_HOST,
+        "port": settings.SERVER_PORT,
+        "backlog": settings.SERVER_BACKLOG,
+        "timeout_keep_alive": settings.SERVER_KEEP_ALIVE_SECONDS,
+        "timeout_graceful_shutdown": settings.SERVER_GRACEFUL_SHUTDOWN_SECONDS,
+    }
+    if settings.SERVER_PRODUCTION:
+        options.update({
+            "workers": settings.SERVER_WORKERS,
+            "loop": "uvloop",
+            "http": "httptools",
+            "proxy_headers": True,
+            "access_log": False,
+        })
+    uvicorn.run("app.main:app", **options)
+
+
 if __name__ == '__main__':
-    uvicorn.run("app.main:app", host="0.0.0.0", port=8000)
+    run()
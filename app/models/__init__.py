@@ -1,11 +1,17 @@
+from . import activity
+from . import blob
 from . import comment
 from . import like
 from . import shader
 from . import user
+from . import user_stats
 
 __all__ = [
+    "activity",
+    "blob",
     "comment",
     "like",
     "shader",
-    "user"
+    "user",
+    "user_stats"
 ]
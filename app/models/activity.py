@@ -0,0 +1,20 @@
+from sqlalchemy import Column, Integer, String, TIMESTAMP, ForeignKey, Index
+
+from app.db.base import Base
+
+
+class Activity(Base):
+    # Лента действий пользователя: лайки, комментарии и форки
+    __tablename__ = "activities"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    type = Column(String, nullable=False)
+    created_at = Column(TIMESTAMP, nullable=False)
+
+    # Внешние ключи
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    shader_id = Column(Integer, ForeignKey("shaders.id", ondelete="CASCADE"), nullable=False)
+
+    __table_args__ = (
+        Index("ix_activities_user_id_created_at_id", user_id, created_at.desc(), id.desc()),
+        Index("ix_activities_shader_id", shader_id),
+    )
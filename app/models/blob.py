@@ -0,0 +1,19 @@
+from sqlalchemy import Column, Integer, String, TIMESTAMP, Index, text
+
+from app.db.base import Base
+
+
+class Blob(Base):
+    # Загруженное изображение по хешу содержимого и число пользователей, которые на него ссылаются
+    __tablename__ = "blobs"
+    sha256 = Column(String(64), primary_key=True)
+    kind = Column(String, primary_key=True)
+
+    ref_count = Column(Integer, nullable=False, default=0, server_default="0")
+    created_at = Column(TIMESTAMP, nullable=False)
+    # Когда на файл перестали ссылаться, после паузы его удаляет сборщик
+    released_at = Column(TIMESTAMP, nullable=True)
+
+    __table_args__ = (
+        Index("ix_blobs_released_at", released_at, postgresql_where=text("ref_count = 0")),
+    )
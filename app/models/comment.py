@@ -1,4 +1,4 @@
-from sqlalchemy import ForeignKey, Integer, TIMESTAMP, Column, String, Boolean
+from sqlalchemy import ForeignKey, Integer, TIMESTAMP, Column, String, Boolean, Index
 
 from app.db.base import Base
 
@@ -14,3 +14,7 @@ class Comment(Base):
     # Внешние ключи
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     shader_id = Column(Integer, ForeignKey("shaders.id", ondelete="CASCADE"), nullable=False)
+
+    __table_args__ = (
+        Index("ix_comments_shader_id_created_at_id", shader_id, created_at, id),
+    )
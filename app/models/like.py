@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, ForeignKey, TIMESTAMP
+from sqlalchemy import Column, Integer, ForeignKey, TIMESTAMP, Index, UniqueConstraint
 
 from app.db.base import Base
 
@@ -11,3 +11,8 @@ class Like(Base):
     # Внешние ключи
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     shader_id = Column(Integer, ForeignKey("shaders.id", ondelete="CASCADE"), nullable=False)
+
+    __table_args__ = (
+        Index("ix_likes_shader_id", shader_id),
+        UniqueConstraint(user_id, shader_id, name="uq_likes_user_id_shader_id"),
+    )
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, TIMESTAMP, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, String, TIMESTAMP, Boolean, ForeignKey, Index, text
 
 from app.db.base import Base
 
@@ -15,5 +15,22 @@ class Shader(Base):
     visibility = Column(Boolean, nullable=False, default=True)
     id_forked = Column(Integer, nullable=True, default=None)
 
+    # Денормализованные счётчики, поддерживаются при записи лайков, комментариев и форков
+    likes_count = Column(Integer, nullable=False, default=0, server_default="0")
+    comments_count = Column(Integer, nullable=False, default=0, server_default="0")
+    forks_count = Column(Integer, nullable=False, default=0, server_default="0")
+
     # Внешние ключи
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+
+    __table_args__ = (
+        Index("ix_shaders_visible_likes_count", likes_count.desc(), id.desc(),
+              postgresql_where=text("visibility")),
+        Index("ix_shaders_visible_comments_count", comments_count.desc(), id.desc(),
+              postgresql_where=text("visibility")),
+        Index("ix_shaders_visible_created_at", created_at.desc(), id.desc(),
+              postgresql_where=text("visibility")),
+        Index("ix_shaders_user_id_created_at", user_id, created_at.desc()),
+        Index("ix_shaders_id_forked", id_forked,
+              postgresql_where=text("id_forked IS NOT NULL")),
+    )
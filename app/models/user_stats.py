@@ -0,0 +1,13 @@
+from sqlalchemy import Column, Integer, ForeignKey
+
+from app.db.base import Base
+
+
+class UserStats(Base):
+    # Сколько лайков, комментариев и форков получили шейдеры пользователя
+    __tablename__ = "user_stats"
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+
+    likes_received = Column(Integer, nullable=False, default=0, server_default="0")
+    comments_received = Column(Integer, nullable=False, default=0, server_default="0")
+    forks_received = Column(Integer, nullable=False, default=0, server_default="0")
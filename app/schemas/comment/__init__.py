@@ -1,5 +1,7 @@
+from . import comment_out
 from . import post_comment
 
 __all__ = [
+    "comment_out.py",
     "post_comment.py"
-]
\ No newline at end of file
+]
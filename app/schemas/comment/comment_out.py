@@ -0,0 +1,17 @@
+from datetime import datetime
+
+from pydantic import BaseModel
+
+
+class CommentOut(BaseModel):
+    id: int
+    text: str
+    hidden: bool
+    created_at: datetime
+    user_id: int
+    shader_id: int
+    username: str | None = None
+    avatar_url: str | None = None
+
+    class Config:
+        from_attributes = True
@@ -1,7 +1,9 @@
+from . import shader_card
 from . import shader_in
 from . import shader_out
 
 __all__ = [
+    "shader_card",
     "shader_in",
     "shader_out"
 ]
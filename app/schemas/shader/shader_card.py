@@ -0,0 +1,10 @@
+from pydantic import BaseModel
+
+
+class ShaderCard(BaseModel):
+    id: int
+    title: str
+    user_id: int
+    username: str
+    likes: int
+    comments: int
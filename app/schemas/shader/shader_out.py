@@ -4,7 +4,7 @@ from datetime import datetime
 class ShaderOut(BaseModel):
     id: int
     title: str
-    description: str
+    description: str | None
     code: str
     visibility: bool
     created_at: datetime
@@ -1,9 +1,15 @@
 from . import dependencies
+from . import hashing
 from . import roles
+from . import tokens
+from . import users
 from . import utils
 
 __all__ = [
     "dependencies",
+    "hashing",
     "roles",
+    "tokens",
+    "users",
     "utils"
 ]
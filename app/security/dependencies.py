@@ -1,15 +1,13 @@
 import datetime
 
-from jose import jwt, JWTError
-from sqlalchemy import select
+from jose import JWTError
 
-from app.db.base import async_session
 from app.exceptions import UserNotAuthenticatedException, InvalidTokenException, TokenExpiredException, \
-    UserIdNotFoundException, UserNotFoundException
-from fastapi import Request, Depends
-from app.models.user import User as MUser
-
-from app.settings import settings
+    UserIdNotFoundException, UserNotFoundException, ForbiddenException
+from fastapi import Request
+from app.security.roles import Role
+from app.security.tokens import decode_token
+from app.security.users import get_user
 
 
 
@@ -22,7 +20,7 @@ async def get_current_user_id(request: Request) -> int:
 
     # Получение тела токена
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        payload = decode_token(token)
     except JWTError:
         raise InvalidTokenException
 
@@ -62,11 +60,16 @@ async def get_current_user(request: Request):
     #     raise UserIdNotFoundException
 
     user_id = await get_current_user_id(request)
-    async with async_session() as session:
-        result = await session.execute(select(MUser).where(MUser.id == int(user_id)))
-        user = result.scalars().first()
+    user = await get_user(user_id)
 
     # Проверка существования пользователя
     if not user:
         raise UserNotFoundException
     return user
+
+
+async def get_current_admin(request: Request):
+    user = await get_current_user(request)
+    if user.role != Role.ADMIN:
+        raise ForbiddenException
+    return user
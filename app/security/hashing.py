@@ -0,0 +1,77 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.exceptions import ServerBusyException
+from app.security.utils import get_password_hash, verify_password, verify_and_update_password
+from app.settings import settings
+
+
+class HashingExecutor:
+    # Ограниченный пул потоков для bcrypt: хеширование не блокирует цикл событий,
+    # а при переполнении очереди запрос сразу отклоняется
+
+    def __init__(self, workers: int, queue_limit: int):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hashing")
+        self.limit = workers + queue_limit
+        self.in_flight = 0
+        self.rejected = 0
+        self.calls = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.hash_seconds_total = 0.0
+        self.hash_seconds_max = 0.0
+
+    async def run(self, fn, *args):
+        if self.in_flight >= self.limit:
+            self.rejected += 1
+            raise ServerBusyException
+
+        submitted = time.perf_counter()
+
+        def timed():
+            started = time.perf_counter()
+            return fn(*args), started - submitted, time.perf_counter() - started
+
+        self.in_flight += 1
+        try:
+            result, wait, duration = await asyncio.get_running_loop().run_in_executor(self._executor, timed)
+        finally:
+            self.in_flight -= 1
+
+        self.calls += 1
+        self.wait_seconds_total += wait
+        self.wait_seconds_max = max(self.wait_seconds_max, wait)
+        self.hash_seconds_total += duration
+        self.hash_seconds_max = max(self.hash_seconds_max, duration)
+        return result
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True)
+
+    def metrics(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "limit": self.limit,
+            "rejected": self.rejected,
+            "calls": self.calls,
+            "wait_seconds_avg": self.wait_seconds_total / self.calls if self.calls else 0.0,
+            "wait_seconds_max": self.wait_seconds_max,
+            "hash_seconds_avg": self.hash_seconds_total / self.calls if self.calls else 0.0,
+            "hash_seconds_max": self.hash_seconds_max,
+        }
+
+
+hashing = HashingExecutor(workers=settings.HASH_WORKERS, queue_limit=settings.HASH_QUEUE_LIMIT)
+
+
+async def hash_password(password: str) -> str:
+    return await hashing.run(get_password_hash, password)
+
+
+async def check_password(plain_password: str, hashed_password: str) -> bool:
+    return await hashing.run(verify_password, plain_password, hashed_password)
+
+
+async def check_and_update_password(plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+    return await hashing.run(verify_and_update_password, plain_password, hashed_password)
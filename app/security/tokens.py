@@ -0,0 +1,60 @@
+import time
+from collections import OrderedDict
+
+from jose import jwt
+
+from app.settings import settings
+
+# Токены длиннее не кэшируются, чтобы объём кэша оставался ограниченным
+MAX_TOKEN_LENGTH = 4096
+
+
+class TokenCache:
+    # Кэш проверенных JWT: токен -> тело токена до момента истечения срока действия
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._key = None
+        self._data: OrderedDict[str, dict] = OrderedDict()
+
+    def decode(self, token: str) -> dict:
+        # При смене ключа подписи все проверенные ранее токены сбрасываются
+        key = (settings.SECRET_KEY, settings.ALGORITHM)
+        if key != self._key:
+            self._data.clear()
+            self._key = key
+
+        payload = self._data.get(token)
+        if payload is not None and payload["exp"] > time.time():
+            self._data.move_to_end(token)
+            self.hits += 1
+            return payload
+        self._data.pop(token, None)
+
+        self.misses += 1
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        if isinstance(payload.get("exp"), (int, float)) and len(token) <= MAX_TOKEN_LENGTH:
+            self._data[token] = payload
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+        return payload
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+
+token_cache = TokenCache(max_size=settings.TOKEN_CACHE_SIZE)
+
+
+def decode_token(token: str) -> dict:
+    return token_cache.decode(token)
@@ -0,0 +1,66 @@
+import asyncio
+import datetime
+
+from sqlalchemy import select
+from sqlalchemy.orm import make_transient_to_detached
+
+from app.cache.base import cache, user_key
+from app.db.base import async_session
+from app.models.user import User as MUser
+from app.settings import settings
+
+# Хеш пароля в кэш не попадает, при смене пароля он читается из основной базы
+CACHED_COLUMNS = [column.key for column in MUser.__table__.columns if column.key != "hashed_password"]
+
+# Загрузки пользователя, которые уже выполняются; одновременные промахи ждут их результата
+pending: dict[int, asyncio.Future] = {}
+
+
+async def get_user(user_id: int) -> MUser | None:
+    data = await cache.get(user_key(user_id))
+    if data is None:
+        future = pending.get(user_id)
+        if future is not None:
+            data = await asyncio.shield(future)
+        else:
+            data = await load_user(user_id)
+
+    if data is None:
+        return None
+
+    # Каждый запрос получает свой экземпляр: его можно изменить и сохранить через session.add
+    user = MUser(**{**data, "created_at": datetime.datetime.fromisoformat(data["created_at"])})
+    make_transient_to_detached(user)
+    return user
+
+
+async def load_user(user_id: int) -> dict | None:
+    future = asyncio.get_running_loop().create_future()
+    pending[user_id] = future
+    try:
+        async with async_session() as session:
+            result = await session.execute(select(MUser).where(MUser.id == user_id))
+            user = result.scalars().first()
+
+        data = None
+        if user is not None:
+            # В кэше только типы JSON, дата хранится строкой
+            data = {key: getattr(user, key) for key in CACHED_COLUMNS}
+            data["created_at"] = user.created_at.isoformat()
+            await cache.set(user_key(user_id), data, settings.USER_CACHE_TTL_SECONDS)
+        future.set_result(data)
+        return data
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        # Исключение получают ожидающие, а если их нет, оно не должно попасть в лог как непрочитанное
+        future.exception()
+        raise
+    finally:
+        del pending[user_id]
+
+
+async def invalidate_user(user_id: int) -> None:
+    await cache.delete(user_key(user_id))
@@ -1,5 +1,6 @@
 from pathlib import Path
 
+from pydantic import model_validator
 from pydantic_settings import BaseSettings
 
 
@@ -9,12 +10,81 @@ class Settings(BaseSettings):
     POSTGRES_ADDRESS: str
     POSTGRES_PORT: int
     POSTGRES_DB: str
-    DATABASE_URL: str
+    DATABASE_URL: str = ""
+    # Лимит соединений сервера Postgres и запас под миграции и админку
+    POSTGRES_MAX_CONNECTIONS: int = 100
+    POSTGRES_RESERVED_CONNECTIONS: int = 10
+
+    # Размер пула по умолчанию рассчитывается из лимита соединений и числа воркеров
+    DB_POOL_SIZE: int | None = None
+    DB_MAX_OVERFLOW: int = 0
+    DB_POOL_TIMEOUT_SECONDS: float = 30
+    DB_POOL_RECYCLE_SECONDS: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    DB_STATEMENT_CACHE_SIZE: int = 100
+    # Режим совместимости с PgBouncer в режиме pool_mode=transaction
+    DB_PGBOUNCER: bool = False
+
+    # Реплики для чтения через запятую, при пустом значении всё идёт в основную базу
+    DB_REPLICA_URLS: str = ""
+    DB_REPLICA_CHECK_INTERVAL_SECONDS: float = 5
+    DB_REPLICA_CHECK_TIMEOUT_SECONDS: float = 2
+    # Сколько после записи чтения клиента идут в основную базу
+    DB_STICKY_SECONDS: int = 5
+    # Отложенная пачечная запись лайков
+    LIKE_BUFFER_ENABLED: bool = False
+    LIKE_BUFFER_FLUSH_INTERVAL_SECONDS: float = 1
+    LIKE_BUFFER_MAX_SIZE: int = 10000
 
     SECRET_KEY: str
     ALGORITHM: str
     ACCESS_TOKEN_EXPIRE_MINUTES: int
     REFRESH_TOKEN_EXPIRE_DAYS: int
+    BCRYPT_ROUNDS: int = 12
+    TOKEN_CACHE_SIZE: int = 10000
+    USER_CACHE_TTL_SECONDS: float = 300
+    # Потоки для bcrypt и сколько запросов может ждать своей очереди
+    HASH_WORKERS: int = 2
+    HASH_QUEUE_LIMIT: int = 32
+
+    SERVER_HOST: str = "0.0.0.0"
+    SERVER_PORT: int = 8000
+    SERVER_PRODUCTION: bool = False
+    SERVER_WORKERS: int = 1
+    SERVER_BACKLOG: int = 2048
+    SERVER_KEEP_ALIVE_SECONDS: int = 5
+    SERVER_GRACEFUL_SHUTDOWN_SECONDS: int = 30
+
+    # Выгрузки NDJSON: сколько потоков одновременно держат соединение чтения и сколько длится самый долгий
+    NDJSON_MAX_STREAMS: int = 4
+    NDJSON_STREAM_TIMEOUT_SECONDS: float = 60
+
+    # Комментарии отдаются страницами, в ответ с шейдером встраивается только первая
+    COMMENTS_PAGE_SIZE: int = 20
+    # Максимальный размер загружаемых аватаров и фонов
+    UPLOAD_MAX_BYTES: int = 5 * 1024 * 1024
+    # Процессы для нарезки изображений и сколько загрузок может ждать своей очереди
+    IMAGE_WORKERS: int = 2
+    IMAGE_QUEUE_LIMIT: int = 8
+    # Как часто удаляются изображения без ссылок и сколько они ещё хранятся после освобождения
+    BLOB_GC_INTERVAL_SECONDS: float = 3600
+    BLOB_GC_GRACE_SECONDS: float = 3600
+    # Внутренний location nginx для отдачи public/ через X-Accel-Redirect, при пустом значении файлы отдаёт приложение
+    STATIC_ACCEL_REDIRECT_PREFIX: str = ""
+
+    CACHE_BACKEND: str = "memory"
+    CACHE_MAX_SIZE: int = 1024
+    CACHE_TTL_SECONDS: float = 30
+    CACHE_KEY_PREFIX: str = ""
+    REDIS_URL: str = "redis://localhost:6379/0"
+
+    @model_validator(mode="after")
+    def check_like_buffer(self):
+        # Буфер живёт в памяти воркера: лайк и снятие лайка, попавшие в разные воркеры,
+        # записались бы в порядке сброса буферов, а не в порядке действий пользователя
+        if self.LIKE_BUFFER_ENABLED and self.SERVER_PRODUCTION and self.SERVER_WORKERS > 1:
+            raise ValueError("LIKE_BUFFER_ENABLED requires a single worker (SERVER_WORKERS=1)")
+        return self
 
     class Config:
         env_file = Path(__file__).parent.parent / ".env"  # Указывает на файл .env
@@ -0,0 +1,59 @@
+import argparse
+import asyncio
+import time
+from unittest import mock
+
+from jose import jwt
+from starlette.requests import Request
+
+from app.security import dependencies
+from app.security.tokens import token_cache
+from app.security.utils import create_access_token
+from app.settings import settings
+
+
+def decode_without_cache(token: str) -> dict:
+    # Так get_current_user_id проверял токен до кэша: подпись на каждый запрос
+    return jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+
+
+def make_request(token: str) -> Request:
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": "/",
+        "headers": [(b"cookie", f"access_token={token}".encode())],
+    })
+
+
+async def measure(requests: list[Request], rounds: int) -> float:
+    # Среднее время зависимости get_current_user_id на один запрос, в микросекундах
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for request in requests:
+            await dependencies.get_current_user_id(request)
+    return (time.perf_counter() - start) / (rounds * len(requests)) * 1e6
+
+
+async def main(users: int, rounds: int) -> None:
+    # Разные пользователи делают повторные запросы со своими токенами
+    requests = [make_request(create_access_token({"sub": str(user_id)})) for user_id in range(1, users + 1)]
+
+    with mock.patch.object(dependencies, "decode_token", decode_without_cache):
+        before = await measure(requests, rounds)
+
+    token_cache.clear()
+    after = await measure(requests, rounds)
+
+    print(f"users={users} rounds={rounds} algorithm={settings.ALGORITHM}")
+    print(f"jwt.decode:  {before:8.2f} us/request")
+    print(f"token cache: {after:8.2f} us/request ({before / after:.1f}x)")
+    print(f"cache: {token_cache.stats()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Стоимость проверки токена на один запрос до и после кэша")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main(args.users, args.rounds))
@@ -0,0 +1,135 @@
+import argparse
+import asyncio
+import statistics
+import time
+
+from sqlalchemy import select, func, literal, literal_column, union_all
+from sqlalchemy.orm import aliased
+
+from app.api.profile import profile_summary, fetch_activities, fetch_profile_shaders, ACTIVITIES_PAGE_SIZE
+from app.db.base import engine
+from app.db.replicas import read_session
+from app.models.comment import Comment as MComment
+from app.models.like import Like as MLike
+from app.models.shader import Shader as MShader
+from app.models.user import User as MUser
+
+
+async def profile_before(user_id: int) -> dict:
+    # Чтения профиля в том виде, в котором они были до объединения: четыре сессии одна за другой,
+    # полная лента из union по лайкам, комментариям и форкам и пересчёт агрегатов по исходным таблицам
+    async with read_session() as session:
+        user = (await session.execute(select(MUser).where(MUser.id == user_id))).scalars().first()
+
+    like_query = (
+        select(MShader.id, MShader.title, MLike.created_at, literal("like").label("like"))
+        .join(MLike, MShader.id == MLike.shader_id)
+        .where(MLike.user_id == user_id)
+    )
+    comment_query = (
+        select(MShader.id, MShader.title, MComment.created_at, literal("comment").label("comment"))
+        .join(MComment, MShader.id == MComment.shader_id)
+        .where(MComment.user_id == user_id)
+    )
+    forked_query = (
+        select(MShader.id, MShader.title, MShader.created_at, literal("fork").label("fork"))
+        .where((MShader.id_forked != None) & (MShader.user_id == user_id))
+    )
+    async with read_session() as session:
+        result = await session.execute(
+            union_all(like_query, comment_query, forked_query)
+            .order_by(literal_column("created_at").desc())
+        )
+        activities = result.all()
+
+    MForkedShader = aliased(MShader)
+    async with read_session() as session:
+        result = await session.execute(
+            select(MShader.id, MShader.title, MShader.description, MShader.visibility, MShader.created_at,
+                   MShader.updated_at, MShader.user_id, MShader.id_forked, MShader.likes_count,
+                   MShader.comments_count, MShader.forks_count,
+                   MForkedShader.title.label("forked_title"), MForkedShader.user_id.label("forked_user_id"))
+            .outerjoin(MForkedShader, MShader.id_forked == MForkedShader.id)
+            .where(MShader.user_id == user_id)
+            .order_by(MShader.created_at.desc())
+        )
+        shaders = result.mappings().all()
+
+    async with read_session() as session:
+        user_shaders = select(MShader.id).where(MShader.user_id == user_id).subquery()
+        result = await session.execute(
+            select(
+                select(func.count(MLike.id))
+                .join_from(MLike, MShader, MLike.shader_id == MShader.id)
+                .where(MShader.user_id == user_id)
+                .scalar_subquery(),
+                select(func.count(MComment.id))
+                .join_from(MComment, MShader, MComment.shader_id == MShader.id)
+                .where(MShader.user_id == user_id)
+                .scalar_subquery(),
+                select(func.count(MShader.id))
+                .where(MShader.id_forked.in_(select(user_shaders.c.id)))
+                .scalar_subquery()
+            )
+        )
+        totals = result.one()
+
+    return {"user": user, "activities": activities[:ACTIVITIES_PAGE_SIZE], "shaders": shaders, "totals": totals}
+
+
+async def profile_after(user_id: int) -> dict:
+    # Текущий get_profile_by_id: сводка одним запросом, затем лента и шейдеры одновременно
+    async with read_session() as session:
+        summary = (await session.execute(profile_summary(user_id))).mappings().first()
+    (activities, _), shaders = await asyncio.gather(
+        fetch_activities(user_id, ACTIVITIES_PAGE_SIZE),
+        fetch_profile_shaders(user_id, True)
+    )
+    return {"summary": summary, "activities": activities, "shaders": shaders}
+
+
+async def measure(load, user_ids: list[int], rounds: int) -> list[float]:
+    timings = []
+    for _ in range(rounds):
+        for user_id in user_ids:
+            start = time.perf_counter()
+            await load(user_id)
+            timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def report(name: str, timings: list[float]) -> None:
+    timings = sorted(timings)
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(f"{name:8} mean {statistics.mean(timings):7.2f} ms  p50 {statistics.median(timings):7.2f} ms  p95 {p95:7.2f} ms")
+
+
+async def main(users: int, rounds: int) -> None:
+    try:
+        # Самые активные авторы и случайные пользователи из засеянной базы (python -m app.db.seed)
+        async with read_session() as session:
+            heavy = (await session.scalars(
+                select(MShader.user_id).group_by(MShader.user_id).order_by(func.count().desc()).limit(users // 2)
+            )).all()
+            rest = (await session.scalars(
+                select(MUser.id).order_by(func.random()).limit(users - len(heavy))
+            )).all()
+        user_ids = list(heavy) + list(rest)
+
+        # Прогрев пула соединений и кэша страниц Postgres
+        await measure(profile_before, user_ids, 1)
+        await measure(profile_after, user_ids, 1)
+
+        print(f"users={len(user_ids)} rounds={rounds}")
+        report("before", await measure(profile_before, user_ids, rounds))
+        report("after", await measure(profile_after, user_ids, rounds))
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Задержка чтений страницы профиля до и после объединения запросов")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(main(args.users, args.rounds))
@@ -0,0 +1,126 @@
+import argparse
+import datetime
+import timeit
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse, Response
+from pydantic import TypeAdapter
+
+from app.api.comments import comment_json
+from app.api.profile import activity_json, profile_shader_json
+from app.api.shaders import SHADER_CARDS, gallery_card
+from app.models.comment import Comment as MComment
+from app.models.shader import Shader as MShader
+from app.schemas.comment.comment_out import CommentOut
+from app.schemas.shader.shader_out import ShaderOut
+
+NOW = datetime.datetime(2026, 1, 1, 12, 0, 0)
+SHADER_OUT = TypeAdapter(ShaderOut)
+COMMENT_OUT = TypeAdapter(CommentOut)
+
+
+def shader_rows(count: int) -> list[dict]:
+    return [{
+        "id": i, "title": f"Shader {i}", "description": "Description " * 5, "visibility": True,
+        "created_at": NOW, "updated_at": NOW, "user_id": 1, "id_forked": i - 1 if i % 5 == 0 else None,
+        "likes_count": i * 3, "comments_count": i, "forks_count": i % 4,
+        "forked_title": f"Shader {i - 1}" if i % 5 == 0 else None, "forked_user_id": 2 if i % 5 == 0 else None,
+    } for i in range(1, count + 1)]
+
+
+def gallery_rows(count: int) -> list[dict]:
+    return [{"id": i, "title": f"Shader {i}", "user_id": i % 50, "username": f"user{i % 50}",
+             "likes": i * 3, "comments": i, "sort_value": NOW} for i in range(count)]
+
+
+def comment_rows(count: int) -> list[dict]:
+    return [{"id": i, "text": "Nice shader! " * 4, "hidden": i % 10 == 0, "created_at": NOW, "user_id": i % 30,
+             "shader_id": 1, "username": f"user{i % 30}", "avatar_url": f"/public/avatars/{i:064x}_64.webp"}
+            for i in range(count)]
+
+
+def activity_rows(count: int) -> list[dict]:
+    return [{"id": i, "shader_id": i, "shader_title": f"Shader {i}", "created_at": NOW, "type": "like"}
+            for i in range(count)]
+
+
+def profile(shaders: int, activities: int) -> dict:
+    return {
+        "id": 1, "email": "user@example.com", "name": "user", "biography": "Biography " * 10,
+        "avatar_url": "/public/avatars/a_256.webp", "background_url": "/public/backgrounds/b_1920.webp",
+        "created_at": NOW,
+        "shaders": [profile_shader_json(row) for row in shader_rows(shaders)],
+        "activities": [activity_json(row) for row in activity_rows(activities)],
+        "total_likes": 100, "total_comments": 50, "total_forks": 5,
+    }
+
+
+def default_response(content) -> bytes:
+    # Прежний путь FastAPI без response_model: jsonable_encoder и стандартный json
+    return JSONResponse(jsonable_encoder(content)).body
+
+
+def endpoints(args) -> dict:
+    gallery = gallery_rows(12)
+    gallery_body = SHADER_CARDS.dump_json(SHADER_CARDS.validate_python([gallery_card(row) for row in gallery]))
+    comments = [comment_json(row) for row in comment_rows(args.comments)]
+    user_profile = profile(args.shaders, 20)
+    activities = [activity_json(row) for row in activity_rows(20)]
+    shader = MShader(id=1, title="Shader", description="Description", code="void main() {}\n" * 50,
+                     visibility=True, created_at=NOW, updated_at=NOW, user_id=1, id_forked=None)
+    comment = MComment(id=1, text="Nice shader!", hidden=False, created_at=NOW, user_id=1, shader_id=1)
+
+    # (до, после) для каждой ручки; после — то, что сейчас выполняется на каждый ответ
+    return {
+        "GET /shaders/ (page)": (
+            lambda: default_response([gallery_card(row) for row in gallery]),
+            # Страница сериализуется при заполнении кэша, ответ отдаёт готовые байты
+            lambda: Response(content=gallery_body, media_type="application/json").body,
+        ),
+        "GET /shaders/ (cache fill)": (
+            lambda: default_response([gallery_card(row) for row in gallery]),
+            lambda: SHADER_CARDS.dump_json(SHADER_CARDS.validate_python([gallery_card(row) for row in gallery])),
+        ),
+        f"GET /comments/{{id}} ({args.comments})": (
+            lambda: default_response(comments),
+            lambda: orjson.dumps(comments),
+        ),
+        f"GET /profile/{{id}} ({args.shaders} shaders)": (
+            lambda: default_response(user_profile),
+            lambda: ORJSONResponse(user_profile).body,
+        ),
+        "GET /profile/{id}/activities": (
+            lambda: default_response(activities),
+            lambda: ORJSONResponse(activities).body,
+        ),
+        "POST /shaders/": (
+            # Прежде возвращался объект ORM и разбирался через jsonable_encoder
+            lambda: default_response(shader),
+            lambda: ORJSONResponse(SHADER_OUT.dump_python(SHADER_OUT.validate_python(shader), mode="json")).body,
+        ),
+        "PATCH /comments/{id}": (
+            lambda: default_response(comment),
+            lambda: ORJSONResponse(COMMENT_OUT.dump_python(COMMENT_OUT.validate_python(comment), mode="json")).body,
+        ),
+    }
+
+
+def measure(fn, number: int) -> float:
+    # Лучшее из пяти повторов, в микросекундах на ответ
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number * 1e6
+
+
+def main(args) -> None:
+    print(f"{'endpoint':36} {'before, us':>12} {'after, us':>12} {'speedup':>8}")
+    for name, (before, after) in endpoints(args).items():
+        before_us, after_us = measure(before, args.number), measure(after, args.number)
+        print(f"{name:36} {before_us:12.2f} {after_us:12.2f} {before_us / after_us:7.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Стоимость сериализации ответа по ручкам до и после orjson")
+    parser.add_argument("--number", type=int, default=1000)
+    parser.add_argument("--comments", type=int, default=20)
+    parser.add_argument("--shaders", type=int, default=50)
+    main(parser.parse_args())
@@ -0,0 +1,70 @@
+import asyncio
+import os
+from pathlib import Path
+
+import httpx
+import pytest
+from sqlalchemy import create_engine, make_url, text
+
+# Обязательные настройки, чтобы app.settings импортировался без .env
+os.environ.setdefault("POSTGRES_USER", "postgres")
+os.environ.setdefault("POSTGRES_PASSWORD", "password")
+os.environ.setdefault("POSTGRES_ADDRESS", "localhost")
+os.environ.setdefault("POSTGRES_PORT", "5432")
+os.environ.setdefault("POSTGRES_DB", "test")
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "15")
+os.environ.setdefault("REFRESH_TOKEN_EXPIRE_DAYS", "7")
+
+# Тесты с базой данных идут только в отдельную базу из TEST_DATABASE_URL: схема в ней пересоздаётся.
+# Приложение и alembic получают тот же адрес, чтобы случайно не попасть в рабочую базу
+ROOT = Path(__file__).parent.parent
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+if TEST_DATABASE_URL:
+    os.environ["DATABASE_URL"] = TEST_DATABASE_URL
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def make_client():
+    # Клиент ходит в приложение напрямую через ASGI; user_id подставляет токен вошедшего пользователя
+    from app.main import app
+    from app.security.utils import create_access_token
+
+    def make(user_id: int | None = None, cookies: dict | None = None, headers: dict | None = None):
+        cookies = dict(cookies or {})
+        if user_id is not None:
+            cookies["access_token"] = create_access_token({"sub": str(user_id)})
+        return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test",
+                                 cookies=cookies, headers=headers)
+    return make
+
+
+@pytest.fixture(scope="session")
+def seeded_database():
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is not set")
+
+    from alembic import command
+    from alembic.config import Config
+
+    from app.db import seed
+
+    engine = create_engine(make_url(TEST_DATABASE_URL).set(drivername="postgresql+psycopg2"))
+    with engine.begin() as connection:
+        connection.execute(text("DROP SCHEMA public CASCADE"))
+        connection.execute(text("CREATE SCHEMA public"))
+
+    # Схема строится миграциями, как в рабочей базе, вместе с индексами из CREATE INDEX CONCURRENTLY
+    config = Config(ROOT / "alembic.ini")
+    config.set_main_option("script_location", str(ROOT / "alembic"))
+    command.upgrade(config, "head")
+
+    asyncio.run(seed.main(users=2000, shaders=20000, likes=200000, comments=100000))
+    yield engine
+    engine.dispose()
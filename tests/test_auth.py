@@ -0,0 +1,49 @@
+import pytest
+from sqlalchemy import select, update
+
+from app.api import auth
+from app.db.base import engine
+from app.models.user import User as MUser
+from app.security.utils import get_password_hash, verify_password
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def user_id(seeded_database):
+    with seeded_database.begin() as connection:
+        user_id = connection.scalar(select(MUser.id).order_by(MUser.id).limit(1))
+        connection.execute(update(MUser).where(MUser.id == user_id).values(hashed_password=get_password_hash("old")))
+    yield user_id
+    await engine.dispose()
+
+
+def stored_hash(seeded_database, user_id: int) -> str:
+    with seeded_database.connect() as connection:
+        return connection.scalar(select(MUser.hashed_password).where(MUser.id == user_id))
+
+
+async def change_password(make_client, user_id: int):
+    async with make_client(user_id=user_id) as client:
+        return await client.patch("/auth/password", json={"oldPassword": "old", "newPassword": "new"})
+
+
+async def test_update_password(seeded_database, make_client, user_id):
+    assert (await change_password(make_client, user_id)).status_code == 200
+    assert verify_password("new", stored_hash(seeded_database, user_id))
+
+
+async def test_update_password_detects_concurrent_change(seeded_database, make_client, user_id, monkeypatch):
+    # Пока считается новый хеш, пароль успевает смениться в другом запросе
+    hash_password = auth.hash_password
+
+    async def hash_after_concurrent_change(password):
+        with seeded_database.begin() as connection:
+            connection.execute(
+                update(MUser).where(MUser.id == user_id).values(hashed_password=get_password_hash("other"))
+            )
+        return await hash_password(password)
+
+    monkeypatch.setattr(auth, "hash_password", hash_after_concurrent_change)
+    assert (await change_password(make_client, user_id)).status_code == 409
+    assert verify_password("other", stored_hash(seeded_database, user_id))
@@ -0,0 +1,134 @@
+import asyncio
+import pickle
+
+import pytest
+from fakeredis import FakeAsyncRedis
+
+from app.api.shaders import ShaderDetail
+from app.cache.memory import MemoryCache
+from app.cache.redis_cache import RedisCache
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(params=["memory", "redis"])
+async def cache(request):
+    if request.param == "memory":
+        backend = MemoryCache(max_size=100, ttl=30)
+    else:
+        # Локальная замена Redis-совместимого сервера, Lua-скрипты выполняются через lupa
+        backend = RedisCache("redis://test", ttl=30, prefix="test:", client=FakeAsyncRedis())
+    yield backend
+    await backend.close()
+
+
+async def test_get_set_and_stats(cache):
+    assert await cache.get("missing") is None
+    await cache.set("key", {"value": [1, 2, 3]})
+    assert await cache.get("key") == {"value": [1, 2, 3]}
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+async def test_get_many_keeps_order(cache):
+    await cache.set("a", 1)
+    await cache.set("c", 3)
+    assert await cache.get_many(["a", "b", "c"]) == [1, None, 3]
+    assert await cache.get_many([]) == []
+    assert cache.stats()["hits"] == 2
+    assert cache.stats()["misses"] == 1
+
+
+async def test_ttl_expires(cache):
+    await cache.set("key", "value", ttl=0.05)
+    assert await cache.get("key") == "value"
+    await asyncio.sleep(0.1)
+    assert await cache.get("key") is None
+
+
+async def test_delete(cache):
+    await cache.set("a", 1)
+    await cache.set("b", 2)
+    await cache.delete("a", "b")
+    assert await cache.get_many(["a", "b"]) == [None, None]
+
+
+async def test_versions(cache):
+    assert await cache.get_version("gallery") == 0
+    assert await cache.bump_version("gallery") == 1
+    assert await cache.bump_version("gallery") == 2
+    assert await cache.get_version("gallery") == 2
+
+
+async def test_lock_is_exclusive_and_owned(cache):
+    token = await cache.acquire_lock("lock:key", ttl=5)
+    assert token is not None
+    assert await cache.acquire_lock("lock:key", ttl=5) is None
+
+    # Чужой токен блокировку не снимает
+    await cache.release_lock("lock:key", "not-the-owner")
+    assert await cache.acquire_lock("lock:key", ttl=5) is None
+
+    await cache.release_lock("lock:key", token)
+    assert await cache.acquire_lock("lock:key", ttl=5) is not None
+
+
+async def test_get_or_set_computes_once_under_stampede(cache):
+    calls = 0
+
+    async def compute():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.2)
+        return "value"
+
+    results = await asyncio.gather(*(cache.get_or_set("key", compute) for _ in range(10)))
+
+    assert results == ["value"] * 10
+    assert calls == 1
+    # Ожидание блокировки не накручивает промахи: по одному на вызов
+    assert cache.stats()["misses"] == 10
+    assert cache.stats()["hits"] == 0
+
+
+async def test_get_or_set_returns_cached(cache):
+    await cache.set("key", "cached")
+
+    async def compute():
+        raise AssertionError("should not be called")
+
+    assert await cache.get_or_set("key", compute) == "cached"
+
+
+async def test_memory_cache_evicts_least_recently_used():
+    cache = MemoryCache(max_size=2, ttl=30)
+    await cache.set("a", 1)
+    await cache.set("b", 2)
+    await cache.get("a")
+    await cache.set("c", 3)
+    assert await cache.get_many(["a", "b", "c"]) == [1, None, 3]
+
+
+async def test_redis_cache_prefix_isolates_keys():
+    client = FakeAsyncRedis()
+    first = RedisCache("redis://test", ttl=30, prefix="first:", client=client)
+    second = RedisCache("redis://test", ttl=30, prefix="second:", client=client)
+    await first.set("key", 1)
+    assert await second.get("key") is None
+    assert await first.get("key") == 1
+
+
+async def test_redis_cache_stores_json():
+    client = FakeAsyncRedis()
+    cache = RedisCache("redis://test", ttl=30, client=client)
+    await cache.set("key", ShaderDetail(True, 1, '"etag"', "{}"))
+    assert await client.get("key") == b'[true,1,"\\"etag\\"","{}"]'
+    assert ShaderDetail(*await cache.get("key")) == ShaderDetail(True, 1, '"etag"', "{}")
+
+
+async def test_redis_cache_does_not_unpickle():
+    client = FakeAsyncRedis()
+    cache = RedisCache("redis://test", ttl=30, client=client)
+    # Подложенный в Redis pickle не распаковывается и считается промахом
+    await client.set("key", pickle.dumps(print))
+    assert await cache.get("key") is None
@@ -0,0 +1,88 @@
+import datetime
+
+from sqlalchemy import select, update, exists, func
+
+from app.api.comments import comments_version
+from app.api.profile import profile_summary
+from app.api.shaders import shader_version
+from app.models.activity import Activity as MActivity
+from app.models.comment import Comment as MComment
+from app.models.shader import Shader as MShader
+from app.models.user import User as MUser
+
+
+def shader_etag_version(connection, shader_id: int) -> tuple:
+    return tuple(connection.execute(select(*shader_version(None)).where(MShader.id == shader_id)).one())
+
+
+def test_shader_version_covers_embedded_data(seeded_database):
+    # Правки засеянной базы откатываются в конце теста
+    with seeded_database.connect() as connection, connection.begin() as transaction:
+        shader_id, parent_id = connection.execute(
+            select(MShader.id, MShader.id_forked)
+            .where((MShader.id_forked != None) & exists().where(MComment.shader_id == MShader.id))
+            .limit(1)
+        ).one()
+        author_id = connection.scalar(
+            select(MComment.user_id)
+            .where(MComment.shader_id == shader_id)
+            .order_by(MComment.created_at.desc(), MComment.id.desc())
+            .limit(1)
+        )
+
+        before = shader_etag_version(connection, shader_id)
+        connection.execute(update(MShader).where(MShader.id == parent_id)
+                           .values(updated_at=datetime.datetime(2100, 1, 1)))
+        parent_edited = shader_etag_version(connection, shader_id)
+        assert parent_edited != before
+
+        connection.execute(update(MUser).where(MUser.id == author_id).values(avatar_url="/public/avatars/new.webp"))
+        assert shader_etag_version(connection, shader_id) != parent_edited
+        transaction.rollback()
+
+
+def test_comments_version_covers_hidden_and_authors(seeded_database):
+    with seeded_database.connect() as connection, connection.begin() as transaction:
+        comment_id, shader_id, author_id = connection.execute(
+            select(MComment.id, MComment.shader_id, MComment.user_id)
+            .where(~MComment.hidden)
+            .order_by(MComment.created_at.desc(), MComment.id.desc())
+            .limit(1)
+        ).one()
+
+        before = tuple(connection.execute(comments_version(shader_id, 100, "desc", None)).one())
+        connection.execute(update(MComment).where(MComment.id == comment_id).values(hidden=True))
+        hidden = tuple(connection.execute(comments_version(shader_id, 100, "desc", None)).one())
+        assert hidden != before
+
+        connection.execute(update(MUser).where(MUser.id == author_id).values(name="renamed"))
+        assert tuple(connection.execute(comments_version(shader_id, 100, "desc", None)).one()) != hidden
+        transaction.rollback()
+
+
+def test_profile_version_covers_shader_counters_and_activity_titles(seeded_database):
+    with seeded_database.connect() as connection, connection.begin() as transaction:
+        user_id = connection.scalar(
+            select(MShader.user_id).group_by(MShader.user_id).having(func.count() > 1).limit(1)
+        )
+        first, second = connection.scalars(select(MShader.id).where(MShader.user_id == user_id).limit(2)).all()
+
+        before = tuple(connection.execute(profile_summary(user_id)).one())
+        # Лайк одному шейдеру и снятие лайка с другого не меняют сумм в user_stats
+        connection.execute(update(MShader).where(MShader.id == first).values(likes_count=MShader.likes_count + 1))
+        connection.execute(update(MShader).where(MShader.id == second).values(likes_count=MShader.likes_count - 1))
+        counters_moved = tuple(connection.execute(profile_summary(user_id)).one())
+        assert counters_moved != before
+
+        # Последнее действие в ленте пользователя ссылается на чужой шейдер, который переименовали
+        activity_user_id, shader_id = connection.execute(
+            select(MActivity.user_id, MActivity.shader_id)
+            .order_by(MActivity.created_at.desc(), MActivity.id.desc())
+            .limit(1)
+        ).one()
+        before = tuple(connection.execute(profile_summary(activity_user_id)).one())
+        # В засеянной базе updated_at бывает и в будущем, поэтому время правки задаётся явно
+        connection.execute(update(MShader).where(MShader.id == shader_id)
+                           .values(title="renamed", updated_at=datetime.datetime(2100, 1, 1)))
+        assert tuple(connection.execute(profile_summary(activity_user_id)).one()) != before
+        transaction.rollback()
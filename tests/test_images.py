@@ -0,0 +1,98 @@
+import os
+
+import pytest
+from fastapi import HTTPException
+from PIL import Image
+from sqlalchemy import select, update
+
+from app.api import uploads
+from app.api.images import ImageExecutor, make_variants, release_image, MAX_IMAGE_PIXELS, VARIANTS
+from app.db.base import engine
+from app.exceptions import ServerBusyException
+from app.models.user import User as MUser
+
+pytestmark = pytest.mark.anyio
+
+
+def crash() -> None:
+    os._exit(1)
+
+
+def square(value: int) -> int:
+    return value * value
+
+
+@pytest.fixture
+def executor():
+    executor = ImageExecutor(workers=1, queue_limit=1)
+    yield executor
+    executor.shutdown()
+
+
+async def test_executor_recovers_from_dead_worker(executor):
+    assert await executor.run(square, 3) == 9
+
+    with pytest.raises(HTTPException) as error:
+        await executor.run(crash)
+    assert error.value is ServerBusyException
+
+    assert await executor.run(square, 4) == 16
+    assert executor.metrics()["restarts"] == 1
+
+
+def test_make_variants(tmp_path):
+    source = tmp_path / "source.png"
+    Image.new("RGB", (400, 300), "red").save(source)
+
+    make_variants(str(source), str(tmp_path / "avatar"), (64, 256), True)
+
+    for size in (64, 256):
+        with Image.open(tmp_path / f"avatar_{size}.webp") as variant:
+            assert variant.size == (size, size)
+
+
+def test_make_variants_rejects_huge_images(tmp_path):
+    # Однотонная картинка сжимается в килобайты, но распаковалась бы в сотню мегабайт
+    source = tmp_path / "bomb.png"
+    Image.new("1", (MAX_IMAGE_PIXELS // 4000 + 1, 4000)).save(source)
+    assert source.stat().st_size < 1024 * 1024
+
+    with pytest.raises(Image.DecompressionBombError):
+        make_variants(str(source), str(tmp_path / "bomb"), (64,), True)
+    assert not list(tmp_path.glob("bomb_*.webp"))
+
+
+@pytest.fixture
+def public_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(uploads, "PUBLIC_DIR", str(tmp_path))
+    (tmp_path / "avatars").mkdir()
+    return tmp_path
+
+
+def legacy_avatar(public_dir) -> str:
+    # Вариант до хранилища: 32 символа хеша в имени, счётчика ссылок нет
+    for size in VARIANTS["avatars"]:
+        (public_dir / f"avatars/{'a' * 32}_{size}.webp").write_bytes(b"webp")
+    return f"avatars/{'a' * 32}_{max(VARIANTS['avatars'])}.webp"
+
+
+async def test_release_legacy_image_removes_every_variant(seeded_database, public_dir):
+    try:
+        await release_image(legacy_avatar(public_dir))
+    finally:
+        await engine.dispose()
+    assert not list(public_dir.glob("avatars/*"))
+
+
+async def test_release_legacy_image_keeps_files_in_use(seeded_database, public_dir):
+    url = legacy_avatar(public_dir)
+    with seeded_database.begin() as connection:
+        user_id = connection.scalar(select(MUser.id).limit(1))
+        connection.execute(update(MUser).where(MUser.id == user_id).values(avatar_url=url))
+    try:
+        await release_image(url)
+    finally:
+        await engine.dispose()
+        with seeded_database.begin() as connection:
+            connection.execute(update(MUser).where(MUser.id == user_id).values(avatar_url=None))
+    assert len(list(public_dir.glob("avatars/*"))) == len(VARIANTS["avatars"])
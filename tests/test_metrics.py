@@ -0,0 +1,25 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.security import dependencies
+from app.models.user import User as MUser
+from app.security.roles import Role
+
+
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+
+def test_metrics_requires_authentication(client):
+    assert client.get("/metrics/").status_code == 401
+
+
+@pytest.mark.parametrize("role, status", [(Role.USER, 403), (Role.ADMIN, 200)])
+def test_metrics_requires_admin(client, monkeypatch, role, status):
+    async def get_current_user(request):
+        return MUser(id=1, role=role.value)
+
+    monkeypatch.setattr(dependencies, "get_current_user", get_current_user)
+    assert client.get("/metrics/").status_code == status
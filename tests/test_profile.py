@@ -0,0 +1,33 @@
+import pytest
+from sqlalchemy import select, func
+
+from app.api.profile import ACTIVITIES_PAGE_SIZE
+from app.db.base import engine
+from app.models.activity import Activity as MActivity
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def active_user_id(seeded_database):
+    with seeded_database.connect() as connection:
+        user_id = connection.scalar(
+            select(MActivity.user_id)
+            .group_by(MActivity.user_id)
+            .having(func.count() > 2 * ACTIVITIES_PAGE_SIZE)
+            .limit(1)
+        )
+    yield user_id
+    await engine.dispose()
+
+
+async def test_profile_pages_activities(make_client, active_user_id):
+    async with make_client() as client:
+        first = await client.get(f"/profile/{active_user_id}")
+        second = await client.get(f"/profile/{active_user_id}", params={"activity_page": 2})
+        # Старые клиенты листают ленту через профиль, ETag у страниц разный
+        repeated = await client.get(f"/profile/{active_user_id}", params={"activity_page": 2},
+                                    headers={"If-None-Match": first.headers["ETag"]})
+    assert first.status_code == second.status_code == repeated.status_code == 200
+    assert len(second.json()["activities"]) == ACTIVITIES_PAGE_SIZE
+    assert second.json()["activities"] != first.json()["activities"]
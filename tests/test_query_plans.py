@@ -0,0 +1,126 @@
+import json
+
+import pytest
+from sqlalchemy import select, func
+from sqlalchemy.dialects import postgresql
+
+from app.api.comments import comments_query, comments_version
+from app.api.profile import (profile_summary, activities_query, profile_shaders_query,
+                             ACTIVITIES_CURSOR, ACTIVITIES_PAGE_SIZE)
+from app.api.shaders import gallery_query, shader_detail_query, shader_version, PAGE_SIZE
+from app.db.pagination import encode_cursor, keyset_condition
+from app.models.comment import Comment as MComment
+from app.models.shader import Shader as MShader
+from app.models.user import User as MUser
+from app.settings import settings
+
+DIALECT = postgresql.dialect()
+
+
+@pytest.fixture(scope="module")
+def sample(seeded_database):
+    # Худший случай засеянной базы: самый активный автор и самый обсуждаемый шейдер
+    with seeded_database.connect() as connection:
+        user_id = connection.scalar(
+            select(MShader.user_id).group_by(MShader.user_id).order_by(func.count().desc()).limit(1)
+        )
+        shader_id = connection.scalar(
+            select(MComment.shader_id).group_by(MComment.shader_id).order_by(func.count().desc()).limit(1)
+        )
+        email = connection.scalar(select(MUser.email).where(MUser.id == user_id))
+        newest = connection.execute(
+            gallery_query(MShader.created_at).offset(PAGE_SIZE * 10).limit(1)
+        ).mappings().one()
+        comment = connection.execute(
+            comments_query(shader_id, "desc", None).offset(settings.COMMENTS_PAGE_SIZE).limit(1)
+        ).mappings().one()
+        activity = connection.execute(
+            activities_query(user_id).offset(ACTIVITIES_PAGE_SIZE).limit(1)
+        ).mappings().one()
+    return {
+        "user_id": user_id,
+        "shader_id": shader_id,
+        "email": email,
+        "gallery_cursor": (newest["sort_value"], newest["id"]),
+        "comments_cursor": encode_cursor("comments_desc", comment["created_at"], comment["id"]),
+        "activities_cursor": encode_cursor(ACTIVITIES_CURSOR, activity["created_at"], activity["id"]),
+    }
+
+
+def gallery_page(sort_column):
+    return lambda sample: gallery_query(sort_column).limit(PAGE_SIZE)
+
+
+# Горячие запросы app/api/* и бюджет стоимости плана на засеянной базе, примерно вдвое выше текущей.
+# Списки без LIMIT и агрегаты стоят пропорционально числу строк самого активного автора и шейдера
+HOT_QUERIES = {
+    "gallery_newest": (gallery_page(MShader.created_at), 50),
+    "gallery_liked": (gallery_page(MShader.likes_count), 50),
+    "gallery_commented": (gallery_page(MShader.comments_count), 50),
+    "gallery_newest_cursor": (
+        lambda sample: gallery_query(MShader.created_at)
+        .where(keyset_condition([MShader.created_at, MShader.id], sample["gallery_cursor"]))
+        .limit(PAGE_SIZE),
+        50
+    ),
+    "gallery_total": (lambda sample: select(func.count(MShader.id)).where(MShader.visibility == True), 2000),
+    "shaders_code": (
+        lambda sample: select(MShader.id, MShader.code)
+        .where(MShader.id.in_(range(sample["shader_id"], sample["shader_id"] + PAGE_SIZE))
+               & ((MShader.visibility == True) | (MShader.user_id == sample["user_id"]))),
+        150
+    ),
+    "shader_version": (
+        lambda sample: select(MShader.visibility, MShader.user_id, *shader_version(sample["user_id"]))
+        .where(MShader.id == sample["shader_id"]),
+        300
+    ),
+    "shader_detail": (lambda sample: shader_detail_query(sample["shader_id"], sample["user_id"]), 500),
+    "shader_detail_anonymous": (lambda sample: shader_detail_query(sample["shader_id"], None), 500),
+    "comments_version": (
+        lambda sample: comments_version(sample["shader_id"], settings.COMMENTS_PAGE_SIZE, "asc", None),
+        2500
+    ),
+    "comments_first_page": (
+        lambda sample: comments_query(sample["shader_id"], "asc", None).limit(settings.COMMENTS_PAGE_SIZE),
+        100
+    ),
+    "comments_desc_cursor": (
+        lambda sample: comments_query(sample["shader_id"], "desc", sample["comments_cursor"])
+        .limit(settings.COMMENTS_PAGE_SIZE),
+        100
+    ),
+    "profile_summary": (lambda sample: profile_summary(sample["user_id"]), 16000),
+    "profile_activities": (lambda sample: activities_query(sample["user_id"]).limit(ACTIVITIES_PAGE_SIZE), 400),
+    "profile_activities_cursor": (
+        lambda sample: activities_query(sample["user_id"], sample["activities_cursor"]).limit(ACTIVITIES_PAGE_SIZE),
+        400
+    ),
+    "profile_shaders_owner": (lambda sample: profile_shaders_query(sample["user_id"], True), 15000),
+    "profile_shaders_public": (lambda sample: profile_shaders_query(sample["user_id"], False), 15000),
+    "login": (lambda sample: select(MUser).where(MUser.email == sample["email"]), 20),
+}
+
+
+def explain(connection, query) -> dict:
+    compiled = query.compile(dialect=DIALECT, compile_kwargs={"render_postcompile": True})
+    result = connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params)
+    plan = result.scalar()
+    return (json.loads(plan) if isinstance(plan, str) else plan)[0]["Plan"]
+
+
+def plan_nodes(plan: dict):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+@pytest.mark.parametrize("name", HOT_QUERIES)
+def test_hot_query_plan(seeded_database, sample, name):
+    build, budget = HOT_QUERIES[name]
+    with seeded_database.connect() as connection:
+        plan = explain(connection, build(sample))
+
+    seq_scans = [node["Relation Name"] for node in plan_nodes(plan) if node["Node Type"] == "Seq Scan"]
+    assert not seq_scans, f"{name}: sequential scan on {seq_scans}"
+    assert plan["Total Cost"] <= budget, f"{name}: plan cost {plan['Total Cost']} exceeds budget {budget}"
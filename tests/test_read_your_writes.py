@@ -0,0 +1,60 @@
+import pytest
+
+from app.api import comments, shaders
+from app.cache.base import cache, comments_key, invalidate_gallery
+from app.db.base import async_session
+from app.db.replicas import STICKY_COOKIE, read_session
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def gallery_calls(monkeypatch):
+    calls = []
+
+    async def fetch_gallery_page(sort, sort_column, value_type, page, cursor):
+        calls.append(page)
+        return b"[]", None
+
+    async def fetch_gallery_total():
+        return 0
+
+    monkeypatch.setattr(shaders, "fetch_gallery_page", fetch_gallery_page)
+    monkeypatch.setattr(shaders, "fetch_gallery_total", fetch_gallery_total)
+    await invalidate_gallery()
+    return calls
+
+
+async def test_gallery_is_cached(make_client, gallery_calls):
+    async with make_client() as client:
+        for _ in range(2):
+            assert (await client.get("/shaders/")).status_code == 200
+    assert gallery_calls == [1]
+
+
+async def test_gallery_bypasses_cache_after_write(make_client, gallery_calls):
+    async with make_client(cookies={STICKY_COOKIE: "1"}) as client:
+        for _ in range(2):
+            assert (await client.get("/shaders/")).status_code == 200
+    assert gallery_calls == [1, 1]
+
+    # Чтение в обход кэша его не заполняет
+    async with make_client() as client:
+        await client.get("/shaders/")
+    assert gallery_calls == [1, 1, 1]
+
+
+async def test_cache_is_filled_from_primary(make_client, monkeypatch):
+    sessions = []
+
+    async def fetch_comments(make_session, shader_id, limit, order, cursor):
+        sessions.append(make_session)
+        return '"etag"', b"[]", None
+
+    monkeypatch.setattr(comments, "fetch_comments", fetch_comments)
+    await cache.delete(comments_key(1))
+    async with make_client() as client:
+        assert (await client.get("/comments/1")).status_code == 200
+        assert (await client.get("/comments/1?order=desc")).status_code == 200
+    # Реплика может отставать, поэтому в общий кэш попадает только прочитанное из основной базы
+    assert sessions == [async_session, read_session]
@@ -0,0 +1,15 @@
+import pytest
+from pydantic import ValidationError
+
+from app.settings import Settings
+
+
+def test_like_buffer_requires_single_worker():
+    with pytest.raises(ValidationError, match="LIKE_BUFFER_ENABLED"):
+        Settings(LIKE_BUFFER_ENABLED=True, SERVER_PRODUCTION=True, SERVER_WORKERS=2)
+
+
+@pytest.mark.parametrize("production, workers", [(True, 1), (False, 4)])
+def test_like_buffer_with_single_worker(production, workers):
+    settings = Settings(LIKE_BUFFER_ENABLED=True, SERVER_PRODUCTION=production, SERVER_WORKERS=workers)
+    assert settings.LIKE_BUFFER_ENABLED
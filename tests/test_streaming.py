@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+from starlette.requests import Request
+
+from app.api import comments, streaming
+from app.api.streaming import NDJSON, StreamLimiter
+from app.security.utils import create_access_token
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeRows:
+    # Подмена выборки и сессии чтения: строки комментариев отдаются по одной с задержкой, база не нужна
+
+    def __init__(self, count: int, delay: float):
+        self.count = count
+        self.delay = delay
+
+    def execution_options(self, **options):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    async def stream(self, query):
+        return self
+
+    def mappings(self):
+        return self
+
+    async def partitions(self):
+        for row_id in range(self.count):
+            await asyncio.sleep(self.delay)
+            yield [{"id": row_id, "hidden": False}]
+
+
+@pytest.fixture
+def limiter(monkeypatch):
+    limiter = StreamLimiter(limit=1, timeout=0.3)
+    monkeypatch.setattr(streaming, "streams", limiter)
+    return limiter
+
+
+@pytest.fixture
+def rows(monkeypatch):
+    def use(count: int, delay: float = 0):
+        fake = FakeRows(count, delay)
+        monkeypatch.setattr(comments, "comments_query", lambda *args: fake)
+        monkeypatch.setattr(streaming, "read_session", lambda: fake)
+    return use
+
+
+async def test_ndjson_requires_authentication(make_client, limiter, rows):
+    rows(2)
+    async with make_client(headers={"Accept": NDJSON}) as client:
+        response = await client.get("/comments/1")
+    assert response.status_code == 401
+    assert limiter.in_flight == 0
+
+
+async def test_ndjson_streams_rows(make_client, limiter, rows):
+    rows(2)
+    async with make_client(user_id=1, headers={"Accept": NDJSON}) as client:
+        response = await client.get("/comments/1")
+    assert response.status_code == 200
+    assert response.text.splitlines() == ['{"id":0,"hidden":false}', '{"id":1,"hidden":false}']
+    assert limiter.completed == 1
+    assert limiter.in_flight == 0
+
+
+async def test_ndjson_rejects_streams_over_limit(make_client, limiter, rows):
+    rows(2, delay=0.05)
+    async with make_client(user_id=1, headers={"Accept": NDJSON}) as client:
+        first, second = await asyncio.gather(client.get("/comments/1"), client.get("/comments/1"))
+    assert [first.status_code, second.status_code] == [200, 503]
+    assert limiter.rejected == 1
+    assert limiter.in_flight == 0
+
+
+async def test_ndjson_stream_times_out(limiter, monkeypatch):
+    # Ответ вызывается напрямую: тестовый клиент не принимает незавершённые ответы
+    token = create_access_token({"sub": "1"})
+    scope = {"type": "http", "method": "GET", "path": "/comments/1",
+             "headers": [(b"cookie", f"access_token={token}".encode())]}
+    messages = []
+
+    async def receive():
+        await asyncio.sleep(10)
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        messages.append(message)
+
+    fake = FakeRows(100, delay=0.05)
+    monkeypatch.setattr(streaming, "read_session", lambda: fake)
+    response = await streaming.ndjson_response(Request(scope), fake)
+    await response(scope, receive, send)
+
+    bodies = [message for message in messages if message["type"] == "http.response.body"]
+    assert 0 < len(bodies) < 100
+    assert bodies[-1]["more_body"]
+    assert limiter.timed_out == 1
+    assert limiter.in_flight == 0
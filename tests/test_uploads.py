@@ -0,0 +1,49 @@
+import httpx
+import pytest
+
+from app.api.uploads import MULTIPART_OVERHEAD
+from app.settings import settings
+
+pytestmark = pytest.mark.anyio
+
+BOUNDARY = "boundary"
+
+
+@pytest.fixture(autouse=True)
+def small_limit(monkeypatch):
+    monkeypatch.setattr(settings, "UPLOAD_MAX_BYTES", 1024)
+
+
+def multipart(size: int, chunk_size: int = 16 * 1024):
+    # Тело отдаётся кусками без Content-Length, как при Transfer-Encoding: chunked
+    async def body():
+        yield (f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"avatar\"; filename=\"a.png\"\r\n"
+               f"Content-Type: image/png\r\n\r\n").encode()
+        for offset in range(0, size, chunk_size):
+            yield b"\0" * min(chunk_size, size - offset)
+        yield f"\r\n--{BOUNDARY}--\r\n".encode()
+    return body()
+
+
+async def post_avatar(client: httpx.AsyncClient, content, **headers) -> httpx.Response:
+    return await client.post("/profile/avatar", content=content,
+                             headers={"Content-Type": f"multipart/form-data; boundary={BOUNDARY}", **headers})
+
+
+async def test_rejects_large_content_length(make_client):
+    async with make_client() as client:
+        response = await post_avatar(client, b"", **{"Content-Length": str(10 * 1024 * 1024)})
+    assert response.status_code == 413
+
+
+async def test_rejects_large_chunked_body(make_client):
+    async with make_client() as client:
+        response = await post_avatar(client, multipart(settings.UPLOAD_MAX_BYTES + MULTIPART_OVERHEAD + 1))
+    assert response.status_code == 413
+
+
+async def test_small_chunked_body_reaches_handler(make_client):
+    async with make_client() as client:
+        response = await post_avatar(client, multipart(100))
+    # Дальше тела дело доходит до проверки входа
+    assert response.status_code == 401